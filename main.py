@@ -1,14 +1,23 @@
 import psycopg2
+import psycopg2.extensions
 import os
 import csv
 import json
 import itertools
 import paramiko
 import time
+import random
 import pandas as pd
 from util.config import db_config
 from util.connection import send_query, get_pg_config, send_query_explain, Connection
 from util.server import Server
+from util.query_template import load_query_templates, PARAMS_SUFFIX
+from util.stats import censored_summary, censored_summary_table, drop_warmup
+from util.plan_analysis import plan_fingerprint, group_by_fingerprint
+from util.plan_metrics import plan_totals, export_plan_metrics, extract_store, PLAN_TOTAL_COLUMNS
+from util.result_store import ResultStore
+from util.plan_presweep import presweep as plan_presweep
+import pyarrow.dataset as ds
 
 def generate_conf_json():
     query = "SHOW all;"
@@ -97,6 +106,9 @@ def get_sql_content(path):
 def get_sql_list(from_here):
     tmp_dct = {}
     for query in os.listdir(from_here):
+        # the value sources of the query templates are not queries
+        if query.endswith(PARAMS_SUFFIX):
+            continue
         tmp_dct[query] = get_sql_content(from_here+"/"+query)
     return tmp_dct
 
@@ -186,26 +198,93 @@ def get_timestamp():
         return int(result[0])
 
 
-def run_test(cold:bool, server:Server, iter_time=10, combination_path="./config/db_conf.json", slower=False):
-    report_path = "./report/report_{}".format(time.strftime("%Y-%m-%d-%H%M%S"))
+##
+#   Time budget of a query: budget_multiplier x its best known total time,
+#   at least min_budget_ms. Without a known time, max_budget_ms is used
+#   (None means no budget).
+#   best_known : best total times of the cache mode of the run, a warm best
+#   time would censor cold runs that are fine.
+##
+def get_time_budget(best_known:dict, sql_name:str, budget_multiplier, min_budget_ms, max_budget_ms):
+    if budget_multiplier is None:
+        return None
+    if sql_name not in best_known:
+        return max_budget_ms
+    budget = max(best_known[sql_name] * budget_multiplier, min_budget_ms)
+    if max_budget_ms is not None:
+        budget = min(budget, max_budget_ms)
+    return budget
+
+##
+#   Best known total times (ms) per cache mode: {"Warm": {sql: ms}, "Cold": {sql: ms}}.
+##
+def load_best_known_times(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as file:
+        best_known = json.load(file)
+    if any(not isinstance(v, dict) for v in best_known.values()):
+        # the times of the first version mixed warm and cold runs
+        print("[WARNING] {} has no cache mode, the best known times are measured again".format(path))
+        return {}
+    return best_known
+
+def save_best_known_times(path, best_known:dict):
+    with open(path, "w") as file:
+        json.dump(best_known, file, indent=4, sort_keys=True)
+
+##
+#   seed : of the values drawn for the query templates (random when None),
+#          written to <report>/seed.txt so that a run can be drawn again
+##
+def run_test(cold:bool, server:Server, iter_time=10, combination_path="./config/db_conf.json", slower=False,
+             budget_multiplier=10, min_budget_ms=1000, max_budget_ms=600000,
+             best_known_path="./report/best_known_times.json",
+             store_path="./results", legacy_report=False, presweep=False, seed=None):
+    run_id = time.strftime("%Y-%m-%d-%H%M%S")
+    report_path = "./report/report_{}".format(run_id)
     if os.path.exists(report_path) == False:
         os.mkdir(report_path)
+    # every measurement goes to the columnar store, the per-query folders
+    # (report.csv, plan/*.json, conf.conf) are only written with legacy_report
+    store = ResultStore(store_path)
+    mode = "Cold" if cold else "Warm"
     query_path = "./raw_queries"
     query_dict = {}
     query_dict = get_sql_list(query_path)
     print("The following test queries are loaded :", query_dict.keys())
     params = db_config("./config/database.ini")
+    # queries with placeholders get fresh values at every iteration
+    templates = load_query_templates(query_path, params)
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    with open(report_path+"/seed.txt", "w") as seed_file:
+        seed_file.write(str(seed))
+    rng = random.Random(seed)
+    # best total time (ms) of every query, the time budgets are derived from it
+    best_known_by_mode = load_best_known_times(best_known_path)
+    best_known = best_known_by_mode.setdefault(mode, {})
     ori = ""
     content = ""
     with open("./config/default.conf", "r") as s:
         for i in s.readlines():
             ori+=i
-    for set in generate_all_possible_config(combination_path):
+    combinations = generate_all_possible_config(combination_path)
+    if presweep:
+        # the measured runs use default.conf plus the combination, the plans
+        # of the pre-pass are taken on default.conf too (the settings out of
+        # the grid are the same)
+        change_pg_conf(ori)
+        # only one combination per plan-equivalence class is measured
+        combinations, plan_classes = plan_presweep(combinations, query_dict, params, templates)
+        plan_classes.to_csv(report_path+"/plan_classes.csv", index=False)
+    for set in combinations:
         content = ori
         conf_alter = ""
         for k, v in set.items():
             conf_alter+="{0}='{1}'\n".format(k, v)
         content+=conf_alter
+        conf_id = store.put_config(set)
         change_pg_conf(content)
         wait_for_cpu()
         # start sending query
@@ -213,6 +292,8 @@ def run_test(cold:bool, server:Server, iter_time=10, combination_path="./config/
         explain = ""
         for k, v in query_dict.items():
             total_time =0
+            n_censored = 0
+            sql_name = str(k.split('.')[0])
             tmp_folder_name = str(k.split('.')[0])+"tmp"
             small_report_path = report_path+"/"+tmp_folder_name
             report_dct = {
@@ -220,15 +301,34 @@ def run_test(cold:bool, server:Server, iter_time=10, combination_path="./config/
                 "exec_time":[],
                 "plan_time":[],
                 "total_time":[],
-                "timestamp":[]
+                "timestamp":[],
+                "params":[],
+                "budget":[],
+                "censored":[],
+                "fingerprint":[],
+                "plan_sha":[],
+                "plan_actuals":[],
+                "plan_extras":[]
             }
-            if os.path.exists(small_report_path) == False:
+            # buffers, temp files and I/O timing of the whole plan
+            for col in PLAN_TOTAL_COLUMNS:
+                report_dct[col] = []
+            if legacy_report == False:
+                # only the bcc records are written there
+                small_report_path = report_path+"/"+conf_id
+            if os.path.exists(small_report_path) == False and (legacy_report or slower):
                 os.mkdir(small_report_path)
             for i in range(iter_time):
                 if cold == True : 
                     clean_cache()
                     wait_for_cpu()
-                conn = Connection(params=params, query=v)
+                query = v
+                drawn = ""
+                if k in templates:
+                    query, values = templates[k].render(rng)
+                    drawn = json.dumps(values, default=str)
+                report_dct["params"].append(drawn)
+                conn = Connection(params=params, query=query)
                 # get the start time timestamp
                 report_dct["timestamp"].append(get_timestamp())
                 # start the ext4slower
@@ -238,7 +338,34 @@ def run_test(cold:bool, server:Server, iter_time=10, combination_path="./config/
                     server.start_record()
                 time.sleep(1)
                 # explain = send_query_explain(params, v) # dict
-                explain = conn.get_explain_of_query() # dict
+                budget = get_time_budget(best_known, sql_name, budget_multiplier, min_budget_ms, max_budget_ms)
+                report_dct["budget"].append(budget)
+                report_dct["sql"].append(str(sql_name+"_"+str(i)))
+                try:
+                    explain = conn.get_explain_of_query(timeout_ms=budget) # dict
+                except psycopg2.extensions.QueryCanceledError:
+                    # right-censored sample: the query runs longer than its budget
+                    print(sql_name, "cancelled after its budget of", budget, "ms")
+                    n_censored += 1
+                    report_dct["exec_time"].append(int(budget))
+                    report_dct["plan_time"].append(None)
+                    report_dct["total_time"].append(int(budget))
+                    report_dct["censored"].append(True)
+                    report_dct["fingerprint"].append(None)
+                    report_dct["plan_sha"].append(None)
+                    report_dct["plan_actuals"].append(None)
+                    report_dct["plan_extras"].append(None)
+                    for col in PLAN_TOTAL_COLUMNS:
+                        report_dct[col].append(None)
+                    if i != 0:
+                        total_time += int(budget)
+                    if os.path.exists(small_report_path+"/bcc") == False and slower:
+                        os.mkdir(small_report_path+"/bcc")
+                    if slower :
+                        server.stop_record(small_report_path+"/bcc/"+sql_name+"_"+str(i)+".csv")
+                    continue
+                finally:
+                    conn.close()
                 explain_json = json.dumps(explain)
                 print(k.split('.')[0], 
                       "exec : ",
@@ -247,44 +374,82 @@ def run_test(cold:bool, server:Server, iter_time=10, combination_path="./config/
                 report_dct["exec_time"].append(int(explain['Execution Time']))
                 report_dct["plan_time"].append(int(explain['Planning Time']))
                 report_dct["total_time"].append(int(explain['Execution Time'])+ int(explain['Planning Time']))
-                report_dct["sql"].append(str(str(k.split('.')[0])+"_"+str(i)))
+                report_dct["censored"].append(False)
+                report_dct["fingerprint"].append(plan_fingerprint(explain))
+                # the plan shape is stored once, the measured values go to the row
+                plan_sha, plan_actuals, plan_extras = store.put_plan(explain)
+                report_dct["plan_sha"].append(plan_sha)
+                report_dct["plan_actuals"].append(plan_actuals)
+                report_dct["plan_extras"].append(plan_extras)
+                for col, value in plan_totals(explain).items():
+                    report_dct[col].append(value)
                 if i != 0:
                     total_time += int(explain['Execution Time'])+ int(explain['Planning Time'])
-                if os.path.exists(small_report_path+"/plan") == False:
-                    os.mkdir(small_report_path+"/plan")
-                with open(small_report_path+"/plan/"+str(k.split('.')[0])+"_"+str(i)+".json", "w") as plan_file:
-                    plan_file.writelines(str(explain_json))
+                measured = explain['Execution Time'] + explain['Planning Time']
+                best_known[sql_name] = min(best_known.get(sql_name, measured), measured)
+                if legacy_report:
+                    if os.path.exists(small_report_path+"/plan") == False:
+                        os.mkdir(small_report_path+"/plan")
+                    with open(small_report_path+"/plan/"+str(k.split('.')[0])+"_"+str(i)+".json", "w") as plan_file:
+                        plan_file.writelines(str(explain_json))
                 # open the folder and store the bcc report (ext4slower)
                 if os.path.exists(small_report_path+"/bcc") == False and slower:
                     os.mkdir(small_report_path+"/bcc")
                 if slower :
                     server.stop_record(small_report_path+"/bcc/"+str(k.split('.')[0])+"_"+str(i)+".csv")
-            if (iter_time == 1):
-                total_time/=1
-            else:
-                total_time/=(iter_time-1)
-            folder_name=str(k.split('.')[0])+"_"+str(int(total_time))
-            if cold :
-                folder_name+="_Cold"
-            else:
-                folder_name+="_Warm"
-            # make sure the name of folder is valid
-            folder_dup = 0
-            ori_folder_name = folder_name
-            while os.path.exists(report_path+"/"+folder_name) == True:
-                folder_dup+=1
-                folder_name = "{0}_{1}".format(ori_folder_name, folder_dup)
-            os.rename(report_path+"/"+tmp_folder_name, report_path+"/"+folder_name)
-            small_report_path = report_path+"/"+folder_name
-            if os.path.exists(small_report_path) == False:
-                os.mkdir(small_report_path)
-            with open(small_report_path+"/conf.conf", "w") as conf_file:
-                conf_file.writelines(conf_alter)
-            # store the report
-            df = pd.DataFrame(report_dct)
-            # df_sorted = df.sort_values(by="total_time", ascending = False)
-            df.to_csv(small_report_path+"/report.csv")
-            # df_sorted.to_csv(small_report_path+"/report2.csv")
+            store.append_measurements(report_dct, run_id, mode, conf_id)
+            save_best_known_times(best_known_path, best_known_by_mode)
+            if legacy_report:
+                write_legacy_report(report_path, tmp_folder_name, sql_name, cold, iter_time,
+                                    total_time, n_censored, conf_alter, report_dct)
+    measurements = store.read_measurements(filter=(ds.field("run") == run_id) & (ds.field("mode") == mode))
+    # latency of every query grouped by the plan it ran with
+    group_by_fingerprint(measurements, "conf_id").to_csv(report_path+"/fingerprint_summary.csv", index=False)
+    # restricted mean and Kaplan-Meier quantiles of every query and configuration,
+    # the runs cancelled by their budget are censored samples
+    pd.DataFrame(censored_summary_table(measurements, ["query", "conf_id"])).to_csv(
+        report_path+"/censored_summary.csv", index=False)
+    # node-level buffer / temp / I/O metrics of every captured plan
+    export_plan_metrics(report_path, extract_store(store, measurements))
+
+##
+#   Per-query folder <query>_<avg>_<Warm|Cold> with report.csv, summary.csv
+#   and conf.conf, as written before the result store existed.
+##
+def write_legacy_report(report_path, tmp_folder_name, sql_name, cold, iter_time,
+                        total_time, n_censored, conf_alter, report_dct):
+    if (iter_time == 1):
+        total_time/=1
+    else:
+        total_time/=(iter_time-1)
+    # with cancelled runs the average is only a lower bound
+    folder_name=sql_name+"_"+str(int(total_time))
+    if cold :
+        folder_name+="_Cold"
+    else:
+        folder_name+="_Warm"
+    if n_censored > 0:
+        folder_name+="_Timeout{}".format(n_censored)
+    # make sure the name of folder is valid
+    folder_dup = 0
+    ori_folder_name = folder_name
+    while os.path.exists(report_path+"/"+folder_name) == True:
+        folder_dup+=1
+        folder_name = "{0}_{1}".format(ori_folder_name, folder_dup)
+    os.rename(report_path+"/"+tmp_folder_name, report_path+"/"+folder_name)
+    small_report_path = report_path+"/"+folder_name
+    if os.path.exists(small_report_path) == False:
+        os.mkdir(small_report_path)
+    with open(small_report_path+"/conf.conf", "w") as conf_file:
+        conf_file.writelines(conf_alter)
+    # store the report, the packed plan values are only for the store
+    df = pd.DataFrame(report_dct).drop(columns=["plan_actuals", "plan_extras"])
+    # df_sorted = df.sort_values(by="total_time", ascending = False)
+    df.to_csv(small_report_path+"/report.csv")
+    # df_sorted.to_csv(small_report_path+"/report2.csv")
+    # without the warm-up run, as the average of the folder name
+    summary = censored_summary(drop_warmup(report_dct["total_time"]), drop_warmup(report_dct["censored"]))
+    pd.DataFrame([summary]).to_csv(small_report_path+"/summary.csv", index=False)
 
 if __name__ == "__main__":
     s = Server('./config/database.ini')
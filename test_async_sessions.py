@@ -0,0 +1,74 @@
+import os
+import time
+import pandas as pd
+from util.config import db_config
+from util.server import Server
+from util.load_driver import latency_summary, result_to_report_dct
+from util.async_connection import run_async_sessions
+from util.query_template import load_query_templates, render_queries
+from main import change_pg_conf, generate_all_possible_config, get_sql_list, wait_for_cpu
+
+##
+#   Reproduce the connection pattern of the application: a lot of sessions,
+#   each one sending a query only from time to time.
+#   The report folders follow the layout of main.run_test, the folder name
+#   holds the average latency and the number of sessions.
+#   The templates of ./raw_queries are drawn once with seed, every session
+#   sends the same SQL.
+##
+def run_test(combination_path, session_counts=(500, 1000, 2000), rate_per_session=0.05, duration=120,
+             seed=0):
+    report_path = "./report/report_async_{}".format(time.strftime("%Y-%m-%d-%H%M%S"))
+    os.makedirs(report_path, exist_ok=True)
+    query_dict = get_sql_list("./raw_queries")
+    print("The following test queries are loaded :", query_dict.keys())
+    params = db_config("./config/database.ini")
+    queries = render_queries(query_dict, load_query_templates("./raw_queries", params), seed)
+    with open("./config/default.conf", "r") as s:
+        ori = s.read()
+    summary = []
+    for set in generate_all_possible_config(combination_path):
+        conf_alter = ""
+        for k, v in set.items():
+            conf_alter += "{0}='{1}'\n".format(k, v)
+        change_pg_conf(ori + conf_alter)
+        wait_for_cpu()
+        for sql_name, v in queries.items():
+            for sessions in session_counts:
+                result = run_async_sessions(params, v, sessions, rate_per_session, duration)
+                stats = latency_summary(result)
+                print(sql_name, sessions, "sessions :", stats)
+                folder_name = "{0}_{1}_{2}sessions".format(sql_name, int(stats["mean_ms"] or 0), sessions)
+                # make sure the name of folder is valid
+                folder_dup = 0
+                ori_folder_name = folder_name
+                while os.path.exists(report_path+"/"+folder_name) == True:
+                    folder_dup += 1
+                    folder_name = "{0}_{1}".format(ori_folder_name, folder_dup)
+                small_report_path = report_path+"/"+folder_name
+                os.mkdir(small_report_path)
+                with open(small_report_path+"/conf.conf", "w") as conf_file:
+                    conf_file.writelines(conf_alter)
+                pd.DataFrame(result_to_report_dct(result, sql_name)).to_csv(small_report_path+"/report.csv")
+                stats.update({"sql": sql_name, "sessions": sessions, "folder": folder_name})
+                summary.append(stats)
+    pd.DataFrame(summary).to_csv(report_path+"/summary.csv")
+
+
+if __name__ == "__main__":
+    s = Server('./config/database.ini')
+    s.connect()
+    if s.is_connect == False:
+        print("ssh connection failed...")
+
+    pg_major_version = s.get_postgresql_major_version()
+    s.disconnect()
+
+    ##
+    # max_connections of the tested configuration must be above the largest session count.
+    ##
+    if pg_major_version in (12, 15):
+        sunbird_conf_path = "./config/db_conf_sunbird_pg{}.json".format(pg_major_version)
+        run_test(sunbird_conf_path)
+    else:
+        print("There might be an issue preventing the test from starting.")
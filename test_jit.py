@@ -0,0 +1,28 @@
+import os
+import time
+from util.config import db_config
+from util.query_template import load_query_templates
+from util.session_sweep import run_jit_sweep, jit_payoff, JIT_GRID
+from main import get_sql_list
+
+##
+#   JIT on / off and its thresholds, set in the session. The report tells
+#   per query whether the compilation time is paid back by the execution.
+##
+def run_test(grid=JIT_GRID, repeat=5, timeout_ms=60000, query_path="./raw_queries"):
+    report_path = "./report/jit_{}".format(time.strftime("%Y-%m-%d-%H%M%S"))
+    os.makedirs(report_path, exist_ok=True)
+    query_dict = get_sql_list(query_path)
+    print("The following test queries are loaded :", query_dict.keys())
+    params = db_config("./config/database.ini")
+    templates = load_query_templates(query_path, params)
+    df = run_jit_sweep(query_dict, params, grid, repeat, timeout_ms, templates)
+    df.to_csv(report_path + "/jit_sweep.csv", index=False)
+    payoff = jit_payoff(df)
+    payoff.to_csv(report_path + "/jit_payoff.csv", index=False)
+    if not payoff.empty:
+        print(payoff[["sql", "jit_off_ms", "best_jit_ms", "jit_compile_ms", "pays_off"]].to_string(index=False))
+
+
+if __name__ == "__main__":
+    run_test()
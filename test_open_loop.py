@@ -0,0 +1,69 @@
+import os
+import time
+import pandas as pd
+from util.config import db_config
+from util.server import Server
+from util.load_driver import find_max_sustainable_qps
+from util.query_template import load_query_templates, render_queries
+from main import change_pg_conf, generate_all_possible_config, get_sql_list, wait_for_cpu
+
+##
+#   For every configuration set and every query, search the maximum arrival
+#   rate (open loop) that keeps the p99 latency below the SLO.
+##
+##
+#   The templates of ./raw_queries are drawn once with seed, every session
+#   sends the same SQL.
+##
+def run_test(combination_path, slo_p99_ms=1000, duration=30, sessions=16, arrival="poisson",
+             backend="thread", processes=8, seed=0):
+    report_path = "./report/open_loop_{}".format(time.strftime("%Y-%m-%d-%H%M%S"))
+    os.makedirs(report_path, exist_ok=True)
+    query_dict = get_sql_list("./raw_queries")
+    print("The following test queries are loaded :", query_dict.keys())
+    params = db_config("./config/database.ini")
+    queries = render_queries(query_dict, load_query_templates("./raw_queries", params), seed)
+    with open("./config/default.conf", "r") as s:
+        ori = s.read()
+    summary = []
+    for conf_id, set in enumerate(generate_all_possible_config(combination_path)):
+        conf_alter = ""
+        for k, v in set.items():
+            conf_alter += "{0}='{1}'\n".format(k, v)
+        change_pg_conf(ori + conf_alter)
+        wait_for_cpu()
+        with open(report_path + "/conf_{}.conf".format(conf_id), "w") as conf_file:
+            conf_file.writelines(conf_alter)
+        for sql_name, v in queries.items():
+            max_qps, steps = find_max_sustainable_qps(
+                params, v, slo_p99_ms, duration=duration, sessions=sessions, arrival=arrival,
+                backend=backend, processes=processes)
+            print(sql_name, "max sustainable qps :", max_qps)
+            df = pd.DataFrame(steps)
+            df.to_csv(report_path + "/{0}_conf_{1}.csv".format(sql_name, conf_id))
+            summary.append({"sql": sql_name, "conf": conf_id, "max_qps": max_qps,
+                            "slo_p99_ms": slo_p99_ms})
+    pd.DataFrame(summary).to_csv(report_path + "/max_qps.csv")
+
+
+if __name__ == "__main__":
+    s = Server('./config/database.ini')
+    s.connect()
+    if s.is_connect == False:
+        print("ssh connection failed...")
+
+    pg_major_version = s.get_postgresql_major_version()
+    s.disconnect()
+
+    if pg_major_version in (12, 15):
+        sunbird_conf_path = "./config/db_conf_sunbird_pg{}.json".format(pg_major_version)
+        v5_conf_path = "./config/db_conf_v5_pg{}.json".format(pg_major_version)
+
+        # p99 SLO in ms, the max qps under this SLO is compared between the config sets
+        run_test(sunbird_conf_path, slo_p99_ms=1000)
+        run_test(v5_conf_path, slo_p99_ms=1000)
+
+        # 200+ sessions: use the process backend, the thread one is limited by the GIL
+        # run_test(sunbird_conf_path, slo_p99_ms=1000, sessions=200, backend="process", processes=8)
+    else:
+        print("There might be an issue preventing the test from starting.")
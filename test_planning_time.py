@@ -0,0 +1,29 @@
+import os
+import time
+from util.config import db_config
+from util.query_template import load_query_templates
+from util.session_sweep import run_planning_sweep, plot_tradeoff, PLANNING_GRID
+from main import get_sql_list
+
+##
+#   Planning time vs execution time of the wide joins under the join
+#   search settings. Everything is set in the session, the configuration
+#   of the server is left as it is.
+##
+def run_test(grid=PLANNING_GRID, repeat_plan=20, repeat_exec=3, timeout_ms=60000, query_path="./raw_queries"):
+    report_path = "./report/planning_{}".format(time.strftime("%Y-%m-%d-%H%M%S"))
+    os.makedirs(report_path, exist_ok=True)
+    query_dict = get_sql_list(query_path)
+    print("The following test queries are loaded :", query_dict.keys())
+    params = db_config("./config/database.ini")
+    templates = load_query_templates(query_path, params)
+    df = run_planning_sweep(query_dict, params, grid, repeat_plan, repeat_exec, timeout_ms, templates)
+    df.to_csv(report_path + "/planning_time.csv", index=False)
+    if "total_ms" in df.columns:
+        best = df.dropna(subset=["total_ms"]).sort_values("total_ms").groupby("sql").head(1)
+        best.to_csv(report_path + "/best_settings.csv", index=False)
+    plot_tradeoff(df, report_path)
+
+
+if __name__ == "__main__":
+    run_test()
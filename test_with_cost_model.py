@@ -6,12 +6,54 @@ import itertools
 import paramiko
 import time
 import shutil
-import fnmatch
+import uuid
+import random
 import pandas as pd
+from configparser import ConfigParser
 from util.config import db_config
 from util.connection import send_query, get_pg_config, send_query_explain, Connection
 from util.server import Server
-from util.path_cost import output_path_cost_info, delete_today_log_file, make_unique_dir
+from util.path_cost import make_unique_dir, PathCostLog, MARKER_SUFFIX, LOG_NAME_SUFFIX
+from util.path_cost import write_log_reference, read_marker, read_log_name, run_path_cost_jobs
+from util.log_shipping import LogShipper
+from util.query_template import load_query_templates, PARAMS_SUFFIX
+
+##
+#   The optimizer debug output of every configuration goes to a log file of
+#   its own (log_filename, rotated by the restart that applies the
+#   configuration), no log has to be deleted to start clean. Once the
+#   server has moved to the next configuration, the log of the previous one
+#   is shipped, its queries analysed, and it is deleted on the server: a
+#   single configuration log stays there, the one of the last configuration.
+##
+PATH_LOG_DIR = "/var/lib/pgsql/data/log"
+PATH_LOG_PREFIX = "pathcost-"
+
+##
+#   Setting of pgsql_mod that turns the path dump on, from the [pathcost]
+#   section of database.ini (debug_guc=<name>). It is off in postgresql.conf
+#   and set on for the benchmark session only, monitoring and other sessions
+#   do not fill the log.
+#   None when the section or the name is missing: a build with the dump
+#   compiled in (OPTIMIZER_DEBUG) has no such setting and prints the paths
+#   of every session, the markers then tell the measured executions apart.
+##
+def path_debug_guc(file_path="./config/database.ini"):
+    parser = ConfigParser()
+    parser.read(file_path)
+    if not parser.has_section("pathcost"):
+        return None
+    return db_config(file_path=file_path, section="pathcost").get("debug_guc") or None
+
+def path_log_filename(run_id:str, conf_no:int):
+    return "{0}{1}-{2:04d}.log".format(PATH_LOG_PREFIX, run_id, conf_no)
+
+def path_log_conf(log_filename:str, debug_guc=None):
+    # no time-based rotation in the middle of a configuration
+    conf = "log_filename='{}'\nlog_rotation_age=0\n".format(log_filename)
+    if debug_guc:
+        conf += "{}='off'\n".format(debug_guc)
+    return conf
 
 def generate_conf_json():
     query = "SHOW all;"
@@ -80,10 +122,7 @@ def restart_postgresql():
         if error:
             print(f"Stop error:\n{error}")
 
-        # Step 2: Delete today's log file
-        delete_today_log_file(client)
-
-        # Step 3: Restart modified PostgreSQL service
+        # Step 2: Restart modified PostgreSQL service
         cmd = ("sudo -i -u postgres /usr/local/pgsql_mod/bin/pg_ctl -D /var/lib/pgsql/data stop; "
                "sudo -i -u postgres /usr/local/pgsql_mod/bin/pg_ctl -D /var/lib/pgsql/data start"
         )
@@ -120,6 +159,9 @@ def get_sql_content(path):
 def get_sql_list(from_here):
     tmp_dct = {}
     for query in os.listdir(from_here):
+        # the value sources of the query templates are not queries
+        if query.endswith(PARAMS_SUFFIX):
+            continue
         tmp_dct[query] = get_sql_content(from_here+"/"+query)
     return tmp_dct
 
@@ -209,9 +251,19 @@ def get_timestamp():
         return int(result[0])
 
 
-def run_test(cold:bool, server:Server, iter_time=10, combination_path="./config/db_conf.json", slower=False):
+##
+#   analyse_path_cost : ship the log of every configuration once the server
+#   has moved to the next one, write the path cost outputs of its queries to
+#   ./path_analysis and delete the log on the server
+#   debug_guc : setting that turns the path dump on, see path_debug_guc
+#   seed : of the values drawn for the query templates (random when None),
+#          written to <report>/seed.txt
+##
+def run_test(cold:bool, server:Server, iter_time=10, combination_path="./config/db_conf.json", slower=False,
+             analyse_path_cost=True, debug_guc=None, seed=None):
     os.makedirs("./path_analysis", exist_ok=True)
-    report_path = "./report/report_{}".format(time.strftime("%Y-%m-%d-%H%M%S"))
+    run_id = time.strftime("%Y-%m-%d-%H%M%S")
+    report_path = "./report/report_{}".format(run_id)
     if os.path.exists(report_path) == False:
         os.mkdir(report_path)
     query_path = "./raw_queries"
@@ -219,18 +271,35 @@ def run_test(cold:bool, server:Server, iter_time=10, combination_path="./config/
     query_dict = get_sql_list(query_path)
     print("The following test queries are loaded :", query_dict.keys())
     params = db_config("./config/database.ini")
+    # queries with placeholders get fresh values at every iteration
+    templates = load_query_templates(query_path, params)
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    with open(report_path+"/seed.txt", "w") as seed_file:
+        seed_file.write(str(seed))
+    rng = random.Random(seed)
     ori = ""
     content = ""
     with open("./config/default.conf", "r") as s:
         for i in s.readlines():
             ori+=i
-    for set in generate_all_possible_config(combination_path):
+    # the path dump is only on for the benchmark sessions
+    debug_guc = debug_guc or path_debug_guc()
+    session_settings = {debug_guc: "on"} if debug_guc else None
+    for conf_no, set in enumerate(generate_all_possible_config(combination_path)):
         content = ori
         conf_alter = ""
         for k, v in set.items():
             conf_alter+="{0}='{1}'\n".format(k, v)
         content+=conf_alter
+        # not in conf_alter, conf.conf only keeps the swept settings
+        log_filename = path_log_filename(run_id, conf_no)
+        content+=path_log_conf(log_filename, debug_guc)
         change_pg_conf(content)
+        # the log of the previous configuration is closed now
+        if analyse_path_cost:
+            tail_remote_log_and_output_path_cost(line_count=-1, local_out_dir="./path_analysis",
+                                                 remove_remote_logs=True, current_log_name=log_filename)
         # wait_for_cpu()
         # start sending query
         # need to store explain and conf
@@ -244,7 +313,8 @@ def run_test(cold:bool, server:Server, iter_time=10, combination_path="./config/
                 "exec_time":[],
                 "plan_time":[],
                 "total_time":[],
-                "timestamp":[]
+                "timestamp":[],
+                "params":[]
             }
             if os.path.exists(small_report_path) == False:
                 os.mkdir(small_report_path)
@@ -252,7 +322,13 @@ def run_test(cold:bool, server:Server, iter_time=10, combination_path="./config/
                 if cold == True : 
                     clean_cache()
                     wait_for_cpu()
-                conn = Connection(params=params, query=v)
+                query = v
+                drawn = ""
+                if k in templates:
+                    query, values = templates[k].render(rng)
+                    drawn = json.dumps(values, default=str)
+                report_dct["params"].append(drawn)
+                conn = Connection(params=params, query=query)
                 # get the start time timestamp
                 report_dct["timestamp"].append(get_timestamp())
                 # start the ext4slower
@@ -262,7 +338,9 @@ def run_test(cold:bool, server:Server, iter_time=10, combination_path="./config/
                     server.start_record()
                 time.sleep(1)
                 # explain = send_query_explain(params, v) # dict
-                explain = conn.get_explain_of_query() # dict
+                # the markers bracket the optimizer debug output of this execution in the log
+                marker = uuid.uuid4().hex
+                explain = conn.get_explain_of_query(settings=session_settings, marker=marker) # dict
                 explain_json = json.dumps(explain)
                 print(k.split('.')[0], 
                       "exec : ",
@@ -278,10 +356,20 @@ def run_test(cold:bool, server:Server, iter_time=10, combination_path="./config/
                     os.mkdir(small_report_path+"/plan")
                 with open(small_report_path+"/plan/"+str(k.split('.')[0])+"_"+str(i)+".json", "w") as plan_file:
                     plan_file.writelines(str(explain_json))
+                with open(small_report_path+"/plan/"+str(k.split('.')[0])+"_"+str(i)+".marker", "w") as marker_file:
+                    marker_file.write(marker)
+                with open(small_report_path+"/plan/"+str(k.split('.')[0])+"_"+str(i)+LOG_NAME_SUFFIX, "w") as log_name_file:
+                    log_name_file.write(log_filename)
                 
-                # open the path_analysis folder and store the explain json file
-                with open("./path_analysis/"+str(k.split('.')[0])+".json", "w") as plan_file:
+                # open the path_analysis folder and store the explain json file,
+                # one per configuration (<sql>_<conf no>)
+                analysis_name = "./path_analysis/{0}_{1:04d}".format(k.split('.')[0], conf_no)
+                with open(analysis_name+".json", "w") as plan_file:
                         plan_file.writelines(str(explain_json))
+                with open(analysis_name+".marker", "w") as marker_file:
+                        marker_file.write(marker)
+                with open(analysis_name+LOG_NAME_SUFFIX, "w") as log_name_file:
+                        log_name_file.write(log_filename)
                 
                 # open the folder and store the bcc report (ext4slower)
                 if os.path.exists(small_report_path+"/bcc") == False and slower:
@@ -314,99 +402,137 @@ def run_test(cold:bool, server:Server, iter_time=10, combination_path="./config/
             # df_sorted = df.sort_values(by="total_time", ascending = False)
             df.to_csv(small_report_path+"/report.csv")
             # df_sorted.to_csv(small_report_path+"/report2.csv")
-            
-
+    # the log of the last configuration is the current log of the server,
+    # it is analysed and kept (deleted by the next run)
+    if analyse_path_cost:
+        tail_remote_log_and_output_path_cost(line_count=-1, local_out_dir="./path_analysis",
+                                             remove_remote_logs=True, current_log_name=log_filename)
+
+
+##
+#   remove_remote_logs : with line_count -1, delete on the server the
+#   configuration logs (pathcost-*) that are shipped and analysed, and the
+#   ones left by a previous run, except current_log_name, still open by
+#   the server
+##
 def tail_remote_log_and_output_path_cost(
     line_count,
-    remote_log_dir="",
-    local_out_dir=""
+    remote_log_dir=PATH_LOG_DIR,
+    local_out_dir="",
+    remove_remote_logs=False,
+    current_log_name=None
 ):
     os.makedirs(local_out_dir, exist_ok=True)
 
-    # SSH/SFTP connection
+    json_files = [f for f in os.listdir(local_out_dir)
+                  if f.endswith(".json")]
+
+    if not json_files and not remove_remote_logs:
+        print("[WARNING] No .json files found to analyse.")
+        return
+
+    # SSH connection
     params = db_config(file_path="./config/database.ini", section='server')
     client = paramiko.SSHClient()
     client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
     client.connect(**params)
-    sftp = client.open_sftp()
 
     try:
-        # Determine the day of the week for the log file name
-        stdin, stdout, stderr = client.exec_command("date +%a", get_pty=True)
-        day_of_week = stdout.read().decode("utf-8", errors="replace").strip()
-
-        remote_log_path = f"{remote_log_dir}/postgresql-{day_of_week}.log"
-        local_log_path  = os.path.join(local_out_dir,
-                                       f"postgresql-{day_of_week}.log")
-
-        # default: -1 means download the whole log file
-        # if line_count is not 0, it will tail the log file
-        if line_count == -1:
-            print(f"[INFO] Downloading full log: {remote_log_path}")
-            try:
-                sftp.get(remote_log_path, local_log_path)
-            except FileNotFoundError:
-                print(f"[ERROR] Remote log not found: {remote_log_path}")
-                return
-        else:
-            cmd = f"tail -n {line_count} {remote_log_path}"
-            print(f"[INFO] Executing on server: {cmd}")
-            stdin, stdout, stderr = client.exec_command(cmd, get_pty=True)
-            out_data = stdout.read().decode("utf-8", errors="replace")
-            err_data = stderr.read().decode("utf-8", errors="replace")
-            if err_data:
-                print(f"[ERROR] stderr from tail: {err_data}")
-                return
-            with open(local_log_path, "w", encoding="utf-8") as f:
-                f.write(out_data)
-
-        # Check if the log file was downloaded successfully
-        if not os.path.exists(local_log_path):
-            print(f"[ERROR] Local log not found: {local_log_path}")
-            return
-
-        # Move .json files to subdirectories
-        # and copy the log file with a new name
-        json_files = [f for f in os.listdir(local_out_dir)
-                      if f.endswith(".json")]
-
-        if not json_files:
-            print("[WARNING] No .json files found to analyse.")
-            return
-
+        # Group the .json files by the log of their configuration (<sql>.logname),
+        # the plan files written without one go to the log of the day
+        day_log_name = None
+        by_log = {}
         for jf in json_files:
-            sql_name   = os.path.splitext(jf)[0]
-            target_dir = make_unique_dir(
-                os.path.join(local_out_dir, sql_name))
-
-            # move the .json file to the new directory
-            shutil.move(os.path.join(local_out_dir, jf),
-                        os.path.join(target_dir, jf))
-
-            # copy the log file to the new directory
-            renamed_log = f"{sql_name}_postgresql-{day_of_week}.log"
-            shutil.copyfile(local_log_path,
-                            os.path.join(target_dir, renamed_log))
-
-            # analyse the log file and output path cost info
-            output_path_cost_info(
-                target_dir,
-                renamed_log,
-                keep_in_place=True
-            )
-        
-        # Remove the original log file if it exists
-        for fname in os.listdir(local_out_dir):
-            if fnmatch.fnmatch(fname, "postgresql-*.log"):
-                target = os.path.join(local_out_dir, fname)
-                try:
-                    os.remove(target)
-                    print(f"[INFO] Removed original log file: {target}")
-                except OSError as e:
-                    print(f"[WARNING] Could not remove {target}: {e}")
+            log_name = read_log_name(os.path.join(local_out_dir, jf))
+            if log_name is None:
+                if day_log_name is None:
+                    stdin, stdout, stderr = client.exec_command("date +%a", get_pty=True)
+                    day_of_week = stdout.read().decode("utf-8", errors="replace").strip()
+                    day_log_name = f"postgresql-{day_of_week}.log"
+                log_name = day_log_name
+            by_log.setdefault(log_name, []).append(jf)
+
+        # default: -1 means ship the whole log file, only the bytes added
+        # since the previous call are transferred (the copy and its index are
+        # kept in <local_out_dir>/logs for the next call)
+        # if line_count is not 0, it will tail the log file, the tailed copy
+        # is kept in <local_out_dir>/tailed (the .ref files of the queries
+        # point to it), a new one per call
+        shipper = LogShipper(client, os.path.join(local_out_dir, "logs")) if line_count == -1 else None
+        tailed_dir = os.path.join(local_out_dir, "tailed")
+        tail_id = time.strftime("%Y-%m-%d-%H%M%S")
+
+        for log_name, log_json_files in by_log.items():
+            remote_log_path = f"{remote_log_dir}/{log_name}"
+            local_log_path  = os.path.join(tailed_dir,
+                                           f"{os.path.splitext(log_name)[0]}-{tail_id}.log")
+
+            if shipper is not None:
+                print(f"[INFO] Shipping log: {remote_log_path}")
+                local_log_path = shipper.fetch(remote_log_path)
+                if local_log_path is None:
+                    continue
+            else:
+                cmd = f"tail -n {line_count} {remote_log_path}"
+                print(f"[INFO] Executing on server: {cmd}")
+                stdin, stdout, stderr = client.exec_command(cmd, get_pty=True)
+                out_data = stdout.read().decode("utf-8", errors="replace")
+                err_data = stderr.read().decode("utf-8", errors="replace")
+                if err_data:
+                    print(f"[ERROR] stderr from tail: {err_data}")
+                    continue
+                os.makedirs(tailed_dir, exist_ok=True)
+                with open(local_log_path, "w", encoding="utf-8") as f:
+                    f.write(out_data)
+
+            # Check if the log file was downloaded successfully
+            if not os.path.exists(local_log_path):
+                print(f"[ERROR] Local log not found: {local_log_path}")
+                continue
+
+            # index the log once, the analysis of every query only reads its blocks
+            path_log = PathCostLog(local_log_path, use_index=True)
+
+            # Move .json files to subdirectories,
+            # with a reference to the log instead of a copy of it
+            jobs = []
+            for jf in log_json_files:
+                sql_name   = os.path.splitext(jf)[0]
+                target_dir = make_unique_dir(
+                    os.path.join(local_out_dir, sql_name))
+
+                # move the .json file to the new directory
+                shutil.move(os.path.join(local_out_dir, jf),
+                            os.path.join(target_dir, jf))
+                for suffix in (MARKER_SUFFIX, LOG_NAME_SUFFIX):
+                    if os.path.exists(os.path.join(local_out_dir, sql_name + suffix)):
+                        shutil.move(os.path.join(local_out_dir, sql_name + suffix),
+                                    os.path.join(target_dir, sql_name + suffix))
+
+                write_log_reference(target_dir, sql_name, path_log,
+                                    read_marker(os.path.join(target_dir, jf)))
+                jobs.append((sql_name, os.path.join(target_dir, jf), target_dir))
+
+            # analyse the log file and output path cost info, one process per query
+            run_path_cost_jobs(path_log, jobs)
+            path_log.close()
+            # the log of the day is not one of ours
+            if (remove_remote_logs and shipper is not None
+                    and log_name.startswith(PATH_LOG_PREFIX) and log_name != current_log_name):
+                shipper.remove_remote(remote_log_path)
+
+        # the configuration logs of a previous run without plan files left,
+        # shipped a last time before they are deleted
+        if remove_remote_logs and shipper is not None:
+            for remote_log_path in list(shipper.state):
+                log_name = os.path.basename(remote_log_path)
+                if (not log_name.startswith(PATH_LOG_PREFIX) or log_name == current_log_name
+                        or log_name in by_log):
+                    continue
+                if shipper.fetch(remote_log_path) is not None:
+                    shipper.remove_remote(remote_log_path)
 
     finally:
-        sftp.close()
         client.close()
 
 
@@ -440,16 +566,19 @@ if __name__ == "__main__":
     # The database could be corrupted if you test using PostgreSQL 15 configurations on PostgreSQL 12.
     ##
     if ready_to_test:
+        # the path cost outputs of every configuration are written to
+        # ./path_analysis as the test goes (analyse_path_cost)
         run_test(False, s, iter_time, sunbird_conf_path) # warm
         
+        # to analyse the last lines of the log of the day instead:
         # line_count is the number of lines to tail from the log file
         # remote_log_dir is the directory of the log file on the remote server
         # local_out_dir is the directory to save the output file on the local machine
-        tail_remote_log_and_output_path_cost(
-            line_count=-1,
-            remote_log_dir="/var/lib/pgsql/data/log",
-            local_out_dir="./path_analysis"
-        )
+        # tail_remote_log_and_output_path_cost(
+        #     line_count=1000000,
+        #     remote_log_dir=PATH_LOG_DIR,
+        #     local_out_dir="./path_analysis"
+        # )
     
     else:
         print("There might be an issue preventing the test from starting.")
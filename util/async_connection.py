@@ -0,0 +1,159 @@
+import array
+import asyncio
+import random
+import time
+import psycopg2
+import psycopg2.extensions
+
+##
+#   Non-blocking counterpart of util.connection.Connection.
+#   It uses the asynchronous mode of psycopg2 and waits for the socket in the
+#   asyncio event loop, so one process can keep thousands of sessions open.
+#   Asynchronous connections are always in autocommit mode.
+##
+class AsyncConnection:
+    def __init__(self, params:dict, query:str) -> None:
+        self.params = params
+        self.query = query
+        self.connect = None
+        self.prepared = "PREPARE" in self.query
+        self.is_prepared = False
+
+    async def open(self):
+        self.connect = psycopg2.connect(**self.params, async_=1)
+        await self._wait()
+
+    async def _wait(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            state = self.connect.poll()
+            if state == psycopg2.extensions.POLL_OK:
+                return
+            fd = self.connect.fileno()
+            ready = loop.create_future()
+
+            def wake():
+                if not ready.done():
+                    ready.set_result(None)
+
+            if state == psycopg2.extensions.POLL_READ:
+                loop.add_reader(fd, wake)
+                try:
+                    await ready
+                finally:
+                    loop.remove_reader(fd)
+            elif state == psycopg2.extensions.POLL_WRITE:
+                loop.add_writer(fd, wake)
+                try:
+                    await ready
+                finally:
+                    loop.remove_writer(fd)
+            else:
+                raise psycopg2.OperationalError("bad state from poll: {}".format(state))
+
+    async def _execute(self, cur, sql:str):
+        cur.execute(sql)
+        await self._wait()
+
+    async def execute_query(self):
+        cur = self.connect.cursor()
+        try:
+            if self.prepared:
+                # the statement only needs to be prepared once per session
+                if not self.is_prepared:
+                    await self._execute(cur, self.query.split("EXECUTE")[0] + "\n")
+                    self.is_prepared = True
+                await self._execute(cur, "EXECUTE "+self.query.split("EXECUTE")[1])
+            else:
+                await self._execute(cur, self.query)
+            if cur.description is not None:
+                cur.fetchall()
+        finally:
+            cur.close()
+
+    def close(self):
+        if self.connect is not None:
+            self.connect.close()
+
+##
+#   Run many mostly-idle sessions in one event loop.
+#   Every session issues the query following its own Poisson schedule of
+#   rate_per_session queries per second, and latency is measured from the
+#   intended start time, as in util.load_driver.run_open_loop.
+#   The result has the same format as the load driver, so
+#   util.load_driver.latency_summary can be used on it.
+##
+async def _run_async_sessions(params:dict, query:str, sessions:int, rate_per_session:float,
+                              duration:float, connect_concurrency:int, seed):
+    rng = random.Random(seed)
+    result = {
+        "intended": array.array("d"),
+        "latency_ms": array.array("d"),
+        "service_ms": array.array("d"),
+        "error": array.array("b"),
+        "error_messages": [],
+    }
+
+    # open the sessions first, with a bounded number of connections in progress
+    connecting = asyncio.Semaphore(connect_concurrency)
+
+    async def open_session():
+        conn = AsyncConnection(params, query)
+        try:
+            async with connecting:
+                await conn.open()
+        except BaseException:
+            # a half-open connection still holds its socket
+            conn.close()
+            raise
+        return conn
+
+    opened = await asyncio.gather(*(open_session() for _ in range(sessions)), return_exceptions=True)
+    connections = [c for c in opened if isinstance(c, AsyncConnection)]
+    failed = [c for c in opened if not isinstance(c, AsyncConnection)]
+    if failed:
+        print("[WARNING] {0} of {1} sessions could not connect : {2}".format(len(failed), sessions, failed[0]))
+    print("{} sessions are connected".format(len(connections)))
+    # the rate of the sessions that really run
+    result["target_qps"] = len(connections) * rate_per_session
+
+    # wall clock for the timestamps of the report only, the schedule and the
+    # latencies are on the monotonic clock of the loop
+    loop = asyncio.get_running_loop()
+    result["start_at"] = time.time()
+    start = loop.time()
+    deadline = start + duration
+
+    async def session(conn, session_rng):
+        intended = start + session_rng.expovariate(rate_per_session)
+        while intended < deadline:
+            delay = intended - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            begin = loop.time()
+            error = 0
+            try:
+                await conn.execute_query()
+            except Exception as e:
+                error = 1
+                if len(result["error_messages"]) < 10:
+                    result["error_messages"].append(str(e))
+            end = loop.time()
+            result["intended"].append(intended - start)
+            result["latency_ms"].append((end - intended) * 1000)
+            result["service_ms"].append((end - begin) * 1000)
+            result["error"].append(error)
+            intended += session_rng.expovariate(rate_per_session)
+
+    try:
+        await asyncio.gather(*(session(c, random.Random(rng.random())) for c in connections))
+    finally:
+        for c in connections:
+            c.close()
+    result["elapsed"] = max(loop.time() - start, duration)
+    return result
+
+def run_async_sessions(params:dict, query:str, sessions=1000, rate_per_session=0.1,
+                       duration=60.0, connect_concurrency=50, seed=None):
+    return asyncio.run(_run_async_sessions(params, query, sessions, rate_per_session,
+                                           duration, connect_concurrency, seed))
@@ -12,6 +12,7 @@ class Connection:
         self.connect.autocommit = True
         self.planning = None
         self.prepared = "PREPARE" in self.query
+        self.is_prepared = False
 
     def get_pid(self):
         with self.connect.cursor() as cur:
@@ -20,10 +21,24 @@ class Connection:
             ret = cur.fetchall()
             return ret[0][0]
 
-    def get_explain_of_query(self):
+    # write "PATHCOST BEGIN|END <marker>" to the server log (RAISE LOG), see util.path_cost
+    def log_marker(self, kind:str, marker:str):
+        with self.connect.cursor() as cur:
+            cur.execute("DO $$ BEGIN RAISE LOG 'PATHCOST {0} {1}'; END $$".format(kind, marker))
+
+    # timeout_ms : statement_timeout of the session, psycopg2.extensions.QueryCanceledError
+    #              is raised when the query runs longer than that
+    # settings : applied to the session first (SET name = value)
+    # marker : uuid hex, the EXPLAIN is bracketed by log markers so that the optimizer
+    #          debug output of this execution can be found in the server log
+    def get_explain_of_query(self, timeout_ms=None, settings:dict=None, marker:str=None):
         explain_prefix = "EXPLAIN (ANALYZE, COSTS, VERBOSE, BUFFERS, FORMAT JSON)\n"
         ready_query = explain_prefix+self.query
         with self.connect.cursor() as cur:
+            if timeout_ms is not None:
+                cur.execute("SET statement_timeout = {}".format(int(timeout_ms)))
+            for k, v in (settings or {}).items():
+                cur.execute("SET {} = %s".format(k), (str(v),))
             if self.prepared :
                 pre_stmt = self.query.split("EXECUTE")[0] + "\n"
                 cur.execute(pre_stmt)
@@ -32,11 +47,53 @@ class Connection:
                 # actually call five time
                 # for i in range(5):
                 #     cur.execute(exe_query)
+            if marker is not None:
+                self.log_marker("BEGIN", marker)
+            try:
+                cur.execute(ready_query)
+                ret = cur.fetchall()
+            finally:
+                if marker is not None:
+                    self.log_marker("END", marker)
+            self.planning = ret[0][0][0]
+            return ret[0][0][0]
+
+    # plan of the query without running it (EXPLAIN without ANALYZE)
+    # settings : planner settings applied to the session first (SET name = value)
+    # summary : add the planning time to the output (EXPLAIN SUMMARY)
+    def get_plan_of_query(self, settings:dict=None, summary=False):
+        explain_prefix = "EXPLAIN (COSTS, VERBOSE, {}FORMAT JSON)\n".format("SUMMARY, " if summary else "")
+        ready_query = explain_prefix+self.query
+        with self.connect.cursor() as cur:
+            for k, v in (settings or {}).items():
+                cur.execute("SET {} = %s".format(k), (str(v),))
+            if self.prepared :
+                # a cached generic plan would ignore the new settings
+                cur.execute("DEALLOCATE ALL")
+                self.is_prepared = False
+                cur.execute(self.query.split("EXECUTE")[0] + "\n")
+                ready_query = explain_prefix+"EXECUTE "+self.query.split("EXECUTE")[1]
             cur.execute(ready_query)
             ret = cur.fetchall()
-            self.planning = ret[0][0][0]
             return ret[0][0][0]
 
+    # run the query itself (no EXPLAIN), the connection can be reused for many calls
+    def execute_query(self):
+        with self.connect.cursor() as cur:
+            if self.prepared :
+                # the statement only needs to be prepared once per session
+                if not self.is_prepared:
+                    cur.execute(self.query.split("EXECUTE")[0] + "\n")
+                    self.is_prepared = True
+                cur.execute("EXECUTE "+self.query.split("EXECUTE")[1])
+            else:
+                cur.execute(self.query)
+            if cur.description is not None:
+                cur.fetchall()
+
+    def close(self):
+        self.connect.close()
+
 def send_query(params:dict, query:str, output_filename:str):
     saved_path = ["sql_output", output_filename]
     ext = ".csv"
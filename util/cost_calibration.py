@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+from util.plan_metrics import extract_report_dir, extract_store
+from util.result_store import ResultStore
+
+##
+#   Calibration of the planner cost constants from the plans we collected.
+#
+#   The planner costs a scan as
+#       seq_page_cost x sequential pages + random_page_cost x random pages
+#       + cpu_tuple_cost x tuples + cpu_index_tuple_cost x index tuples
+#       + cpu_operator_cost x operator evaluations
+#   The same components are measured on every executed scan node (buffers,
+#   rows and rows removed) and its exclusive time is regressed on them.
+#   The fitted ms per unit, divided by the ms per sequential page, are the
+#   constants of our hardware on the seq_page_cost = 1 scale.
+#   Only scan nodes are used: the time of joins, sorts and aggregates
+#   depends on work the cost constants do not describe.
+##
+SEQ_SCAN_TYPES = ("Seq Scan",)
+RANDOM_SCAN_TYPES = ("Index Scan", "Index Only Scan", "Bitmap Heap Scan", "Bitmap Index Scan")
+INDEX_SCAN_TYPES = ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+# (cost constant, regression component), the first one is the reference
+COST_COMPONENTS = (
+    ("seq_page_cost", "seq_pages"),
+    ("random_page_cost", "random_pages"),
+    ("cpu_tuple_cost", "tuples"),
+    ("cpu_index_tuple_cost", "index_tuples"),
+    ("cpu_operator_cost", "operator_evals"),
+)
+
+def _number(nodes, column):
+    return pd.to_numeric(nodes[column], errors="coerce").fillna(0).to_numpy(dtype=float)
+
+##
+#   Number of operators evaluated per input row by a predicate, counted as
+#   its ANDed / ORed conditions.
+##
+def count_operators(predicate):
+    if not isinstance(predicate, str) or not predicate:
+        return 0
+    upper = predicate.upper()
+    return 1 + upper.count(" AND ") + upper.count(" OR ")
+
+##
+#   One row per executed scan node with the regression components and the
+#   exclusive time. The buffer counters are totals over the loops, the row
+#   counts are averages per loop.
+##
+def cost_components(nodes: pd.DataFrame):
+    scans = nodes[nodes["node_type"].isin(SEQ_SCAN_TYPES + RANDOM_SCAN_TYPES)].copy()
+    scans = scans[_number(scans, "loops") > 0]
+    loops = _number(scans, "loops")
+    pages = _number(scans, "shared_hit_excl") + _number(scans, "shared_read_excl")
+    rows_in = (_number(scans, "actual_rows") + _number(scans, "rows_removed")) * loops
+    is_seq = scans["node_type"].isin(SEQ_SCAN_TYPES).to_numpy()
+    is_index = scans["node_type"].isin(INDEX_SCAN_TYPES).to_numpy()
+    scans["seq_pages"] = np.where(is_seq, pages, 0.0)
+    scans["random_pages"] = np.where(is_seq, 0.0, pages)
+    # bitmap index scans return a bitmap, not tuples
+    scans["tuples"] = np.where(scans["node_type"] == "Bitmap Index Scan", 0.0, rows_in)
+    scans["index_tuples"] = np.where(is_index, rows_in, 0.0)
+    scans["operator_evals"] = rows_in * scans["predicate"].map(count_operators).to_numpy(dtype=float)
+    return scans
+
+##
+#   Least squares without intercept and with non-negative coefficients:
+#   the column with the most negative coefficient is dropped until none is.
+##
+def nonnegative_lstsq(x, y):
+    coef = np.zeros(x.shape[1])
+    active = [j for j in range(x.shape[1]) if np.any(x[:, j] != 0)]
+    while active:
+        # columns scaled to unit norm, the components differ by orders of magnitude
+        norm = np.linalg.norm(x[:, active], axis=0)
+        fitted = np.linalg.lstsq(x[:, active] / norm, y, rcond=None)[0] / norm
+        if np.all(fitted >= 0):
+            coef[active] = fitted
+            break
+        active.pop(int(np.argmin(fitted)))
+    return coef
+
+def _constants(coef):
+    if coef[0] <= 0:
+        return None
+    return coef / coef[0]
+
+##
+#   Fit the components to the exclusive times. Returns one row per cost
+#   constant: ms per unit, the calibrated value (seq_page_cost = 1) and its
+#   bootstrap confidence interval. The bootstrap resamples whole plans, the
+#   nodes of one plan are not independent.
+##
+def calibrate(nodes: pd.DataFrame, n_bootstrap=200, confidence=0.9, seed=0):
+    scans = cost_components(nodes)
+    components = [c for _, c in COST_COMPONENTS]
+    if scans.empty or not np.any(scans["seq_pages"].to_numpy() > 0):
+        print("[WARNING] No sequential scan with buffers to calibrate against"
+              " (EXPLAIN must run with BUFFERS)")
+        return None
+    x = scans[components].to_numpy(dtype=float)
+    y = scans["exclusive_ms"].to_numpy(dtype=float)
+    coef = nonnegative_lstsq(x, y)
+    values = _constants(coef)
+    if values is None:
+        print("[WARNING] The sequential pages explain none of the scan time, nothing to calibrate")
+        return None
+    plan_ids = scans.groupby(["report", "folder", "sql"]).ngroup().to_numpy()
+    plans = np.unique(plan_ids)
+    rows_of_plan = [np.flatnonzero(plan_ids == p) for p in plans]
+    rng = np.random.default_rng(seed)
+    samples = []
+    for _ in range(n_bootstrap):
+        picked = np.concatenate([rows_of_plan[p] for p in rng.integers(0, len(plans), len(plans))])
+        sample = _constants(nonnegative_lstsq(x[picked], y[picked]))
+        if sample is not None:
+            samples.append(sample)
+    tail = (1.0 - confidence) / 2 * 100
+    if samples:
+        low, high = np.percentile(np.array(samples), [tail, 100 - tail], axis=0)
+    else:
+        low = high = np.full(len(components), np.nan)
+    residual = y - x @ coef
+    r2 = 1.0 - residual.dot(residual) / max(((y - y.mean()) ** 2).sum(), 1e-12)
+    return pd.DataFrame({
+        "parameter": [p for p, _ in COST_COMPONENTS],
+        "component": components,
+        "observations": [int(np.count_nonzero(x[:, j])) for j in range(len(components))],
+        "ms_per_unit": coef,
+        "value": values,
+        "ci_low": low,
+        "ci_high": high,
+        "r2": r2,
+        "nodes": len(y),
+        "plans": len(plans),
+    })
+
+##
+#   Copy of a combination JSON (see generate_all_possible_config) where every
+#   calibrated constant is replaced by [ci low, value, ci high]. Constants the
+#   data says nothing about keep their values.
+##
+def narrowed_grid(calibration: pd.DataFrame, base_conf_path, out_path):
+    with open(base_conf_path, "r") as file:
+        conf = json.load(file)
+    for _, row in calibration.iterrows():
+        if row["parameter"] == "seq_page_cost" or row["observations"] == 0 or row["value"] <= 0:
+            continue
+        grid = [row["ci_low"], row["value"], row["ci_high"]]
+        grid = [v for v in grid if np.isfinite(v) and v > 0]
+        conf[row["parameter"]] = sorted({"{:.4g}".format(v) for v in grid}, key=float)
+    conf["seq_page_cost"] = ["1"]
+    # same layout as the JSON files of ./config, one parameter per line
+    lines = ["\t{0}:{1}".format(json.dumps(k), json.dumps(v)) for k, v in conf.items()]
+    with open(out_path, "w") as file:
+        file.write("{\n" + ",\n".join(lines) + "\n}\n")
+    print("[INFO] The narrowed grid has been saved to:", out_path)
+    return conf
+
+def print_calibration(calibration: pd.DataFrame):
+    print("Calibrated cost constants ({0} scan nodes of {1} plans, r2 = {2:.3f}):".format(
+        calibration["nodes"].iloc[0], calibration["plans"].iloc[0], calibration["r2"].iloc[0]))
+    for _, row in calibration.iterrows():
+        if row["observations"] == 0:
+            print("  {0:22s} no observation".format(row["parameter"]))
+            continue
+        print("  {0:22s} {1:10.4g}  [{2:.4g}, {3:.4g}]  ({4:.3g} ms per {5})".format(
+            row["parameter"], row["value"], row["ci_low"], row["ci_high"],
+            row["ms_per_unit"], row["component"]))
+
+
+if __name__ == "__main__":
+    # python -m util.cost_calibration base_conf.json narrowed_conf.json ./report/report_<ts> [...]
+    # python -m util.cost_calibration base_conf.json narrowed_conf.json --store ./results [run id]
+    if len(sys.argv) < 4:
+        print("usage: python -m util.cost_calibration <base_conf.json> <out_conf.json>"
+              " <report dir> [...] | --store <root> [run id]")
+        sys.exit(1)
+    base_conf_path, out_path = sys.argv[1], sys.argv[2]
+    if sys.argv[3] == "--store":
+        store = ResultStore(sys.argv[4])
+        run_filter = ds.field("run") == sys.argv[5] if len(sys.argv) > 5 else None
+        nodes = extract_store(store, store.read_measurements(filter=run_filter))
+    else:
+        frames = [extract_report_dir(path) for path in sys.argv[3:]]
+        frames = [f for f in frames if not f.empty]
+        nodes = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    calibration = calibrate(nodes) if not nodes.empty else None
+    if calibration is None:
+        print("[WARNING] Nothing to calibrate")
+        sys.exit(1)
+    print_calibration(calibration)
+    calibration.to_csv(os.path.splitext(out_path)[0] + "_calibration.csv", index=False)
+    narrowed_grid(calibration, base_conf_path, out_path)
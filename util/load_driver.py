@@ -0,0 +1,338 @@
+import array
+import math
+import multiprocessing
+import random
+import threading
+import time
+from util.connection import Connection
+
+##
+#   Build the intended start times (in seconds from the start of the run)
+#   of an open-loop schedule.
+#     • poisson → exponential inter-arrival times with mean 1/rate
+#     • fixed   → one query every 1/rate seconds
+##
+def arrival_schedule(rate: float, duration: float, arrival="poisson", seed=None):
+    if rate <= 0:
+        raise ValueError("rate must be positive, got {}".format(rate))
+    rng = random.Random(seed)
+    schedule = []
+    t = 0.0
+    while True:
+        if arrival == "poisson":
+            t += rng.expovariate(rate)
+        elif arrival == "fixed":
+            t += 1.0 / rate
+        else:
+            raise ValueError("Unknown arrival process: {}".format(arrival))
+        if t >= duration:
+            break
+        schedule.append(t)
+    return schedule
+
+##
+#   Nearest-rank percentile of an already sorted list.
+##
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    rank = max(int(math.ceil(p / 100.0 * len(sorted_values))), 1)
+    return sorted_values[rank - 1]
+
+##
+#   Summarize the samples collected by one run of the driver.
+##
+def latency_summary(result: dict):
+    ok = sorted(l for l, e in zip(result["latency_ms"], result["error"]) if not e)
+    errors = sum(1 for e in result["error"] if e)
+    elapsed = result["elapsed"]
+    return {
+        "target_qps": result["target_qps"],
+        "achieved_qps": len(ok) / elapsed if elapsed > 0 else 0.0,
+        "count": len(ok),
+        "errors": errors,
+        "mean_ms": sum(ok) / len(ok) if ok else None,
+        "p50_ms": percentile(ok, 50),
+        "p90_ms": percentile(ok, 90),
+        "p99_ms": percentile(ok, 99),
+        "max_ms": ok[-1] if ok else None,
+    }
+
+##
+#   Convert the samples of a driver run to the columns of the report.csv
+#   written by run_test (one row per executed query, times in ms).
+#   The driver does not EXPLAIN the queries: exec_time, plan_time and
+#   total_time (server side) are left empty, the client side times are in
+#   latency_ms (from the intended start, queueing included) and service_ms.
+##
+def result_to_report_dct(result: dict, sql_name: str):
+    report_dct = {
+        "sql":[],
+        "exec_time":[],
+        "plan_time":[],
+        "total_time":[],
+        "timestamp":[],
+        "latency_ms":[],
+        "service_ms":[],
+        "error":[]
+    }
+    order = sorted(range(len(result["intended"])), key=lambda i: result["intended"][i])
+    for n, i in enumerate(order):
+        report_dct["sql"].append("{0}_{1}".format(sql_name, n))
+        report_dct["exec_time"].append(None)
+        report_dct["plan_time"].append(None)
+        report_dct["total_time"].append(None)
+        report_dct["timestamp"].append(int(result["start_at"] + result["intended"][i]))
+        report_dct["latency_ms"].append(result["latency_ms"][i])
+        report_dct["service_ms"].append(result["service_ms"][i])
+        report_dct["error"].append(bool(result["error"][i]))
+    return report_dct
+
+##
+#   perf_counter() time of a wall clock time. The start of a run is shared
+#   between the processes as a wall clock time, every process converts it
+#   once and schedules and measures on its own monotonic clock, a step of
+#   the wall clock does not move the samples.
+##
+def _perf_time_of(wall_time: float):
+    return time.perf_counter() + (wall_time - time.time())
+
+##
+#   Number of sessions of every process: sessions spread as evenly as
+#   possible, no process without a session.
+##
+def split_sessions(sessions: int, processes: int):
+    if sessions < 1 or processes < 1:
+        raise ValueError("sessions and processes must be positive, got {0} and {1}".format(sessions, processes))
+    processes = min(processes, sessions)
+    return [sessions // processes + (1 if p < sessions % processes else 0) for p in range(processes)]
+
+##
+#   Run the sessions of one driver (one process) and collect the samples in
+#   compact arrays instead of lists of Python objects.
+#   schedule is the list of intended start times in seconds from start_at
+#   (wall clock, so that several processes can share it).
+#   If schedule is None the sessions run closed loop until the duration ends.
+#   shared_index : multiprocessing.Value of the next arrival of the schedule,
+#   shared by the processes of the multiprocess driver (None: one process)
+##
+def _drive_sessions(params: dict, query: str, schedule, start_at: float, duration: float, sessions: int,
+                    shared_index=None):
+    samples = {
+        "intended": array.array("d"),
+        "latency_ms": array.array("d"),
+        "service_ms": array.array("d"),
+        "error": array.array("b"),
+    }
+    error_messages = []
+    lock = threading.Lock()
+    next_index = [0]
+
+    # index of the next arrival to run, None when the schedule is done
+    def take_arrival():
+        if shared_index is not None:
+            with shared_index.get_lock():
+                i = shared_index.value
+                if i >= len(schedule):
+                    return None
+                shared_index.value += 1
+                return i
+        with lock:
+            i = next_index[0]
+            if i >= len(schedule):
+                return None
+            next_index[0] += 1
+            return i
+
+    connections = [Connection(params=params, query=query) for _ in range(sessions)]
+    start = _perf_time_of(start_at)
+    deadline = start + duration
+
+    def session(conn):
+        while True:
+            if schedule is None:
+                intended = max(time.perf_counter(), start)
+                if intended >= deadline:
+                    return
+            else:
+                i = take_arrival()
+                if i is None:
+                    return
+                intended = start + schedule[i]
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            begin = time.perf_counter()
+            failed = 0
+            try:
+                conn.execute_query()
+            except Exception as e:
+                failed = 1
+                with lock:
+                    if len(error_messages) < 10:
+                        error_messages.append(str(e))
+            end = time.perf_counter()
+            with lock:
+                samples["intended"].append(intended - start)
+                samples["latency_ms"].append((end - intended) * 1000)
+                samples["service_ms"].append((end - begin) * 1000)
+                samples["error"].append(failed)
+
+    threads = [threading.Thread(target=session, args=(c,)) for c in connections]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for c in connections:
+        c.close()
+    return samples, error_messages
+
+##
+#   Open-loop driver: the queries are issued following a fixed schedule,
+#   whatever the server does. Every session takes the next intended start
+#   time of the schedule, waits for it if it is early, and runs the query.
+#   Latency is measured from the intended start time, so a query that had to
+#   wait for a free session is charged for the waiting as well
+#   (coordinated omission correction).
+##
+def run_open_loop(params: dict, query: str, rate: float, duration=30.0,
+                  sessions=16, arrival="poisson", seed=None):
+    schedule = arrival_schedule(rate, duration, arrival, seed)
+    start_at = time.time() + 0.1   # give every session the time to start
+    start = _perf_time_of(start_at)
+    samples, error_messages = _drive_sessions(params, query, schedule, start_at, duration, sessions)
+    result = dict(samples)
+    result["target_qps"] = rate
+    result["start_at"] = start_at
+    result["error_messages"] = error_messages
+    result["elapsed"] = max(time.perf_counter() - start, duration)
+    return result
+
+##
+#   Body of one process of the multiprocess driver: run its sessions, then
+#   send the samples back through the pipe as raw array bytes.
+##
+def _process_main(pipe, params, query, schedule, start_at, duration, sessions, shared_index):
+    try:
+        samples, error_messages = _drive_sessions(params, query, schedule, start_at, duration, sessions,
+                                                  shared_index)
+        for key in ("intended", "latency_ms", "service_ms", "error"):
+            pipe.send_bytes(samples[key].tobytes())
+        pipe.send(error_messages)
+    finally:
+        pipe.close()
+
+##
+#   Multiprocess driver: the sessions are spread over several processes,
+#   each one with its own connections, so that result decoding on the client
+#   side is not serialized by the GIL.
+#   With a rate the processes share the schedule (open loop): the next
+#   arrival is taken from a shared counter by the first free session of any
+#   process, as in the single-process driver, so a slow process does not
+#   queue arrivals that an idle session elsewhere could run.
+#   Without a rate every session runs closed loop for the duration.
+#   The samples of every process are merged into one result.
+#   sessions_per_process is a number of sessions, the same for every
+#   process, or the list of the numbers of sessions of every process
+#   (see split_sessions).
+##
+def run_multiprocess(params: dict, query: str, rate=None, duration=30.0,
+                     processes=8, sessions_per_process=25, arrival="poisson", seed=None):
+    if isinstance(sessions_per_process, int):
+        sessions_per_process = [sessions_per_process] * processes
+    processes = len(sessions_per_process)
+    schedule = None
+    if rate is not None:
+        schedule = arrival_schedule(rate, duration, arrival, seed)
+    # leave the time to every process to open its connections
+    start_at = time.time() + 2.0 + 0.05 * sum(sessions_per_process)
+    start = _perf_time_of(start_at)
+    shared_index = multiprocessing.Value("q", 0) if schedule is not None else None
+    workers = []
+    for p in range(processes):
+        parent, child = multiprocessing.Pipe(duplex=False)
+        proc = multiprocessing.Process(
+            target=_process_main,
+            args=(child, params, query, schedule, start_at, duration, sessions_per_process[p], shared_index))
+        proc.start()
+        child.close()
+        workers.append((proc, parent))
+
+    result = {
+        "intended": array.array("d"),
+        "latency_ms": array.array("d"),
+        "service_ms": array.array("d"),
+        "error": array.array("b"),
+        "error_messages": [],
+    }
+    for proc, parent in workers:
+        # the samples of a process are kept only once all of them arrived,
+        # the columns of the result stay the same length
+        parts = {}
+        try:
+            for key in ("intended", "latency_ms", "service_ms", "error"):
+                parts[key] = array.array(result[key].typecode)
+                parts[key].frombytes(parent.recv_bytes())
+            error_messages = parent.recv()
+        except EOFError:
+            print("[WARNING] driver process {} ended without sending its samples".format(proc.pid))
+        else:
+            for key, part in parts.items():
+                result[key].extend(part)
+            result["error_messages"].extend(error_messages)
+        proc.join()
+    result["target_qps"] = rate
+    result["start_at"] = start_at
+    result["elapsed"] = max(time.perf_counter() - start, duration)
+    return result
+
+##
+#   Find the highest arrival rate whose p99 latency stays below the SLO.
+#   The rate is doubled until the SLO is broken, then the interval between the
+#   last good and the first bad rate is bisected.
+#   backend is "thread" (one process) or "process" (run_multiprocess).
+#   Returns (max sustainable qps, list of the summaries of every step).
+##
+def find_max_sustainable_qps(params: dict, query: str, slo_p99_ms: float,
+                             start_rate=1.0, max_rate=10000.0, duration=30.0,
+                             sessions=16, arrival="poisson", bisect_steps=4,
+                             backend="thread", processes=8):
+    steps = []
+
+    def sustainable(rate):
+        if backend == "process":
+            # the sessions are spread evenly over the processes
+            result = run_multiprocess(params, query, rate, duration, processes,
+                                      split_sessions(sessions, processes), arrival)
+        elif backend == "thread":
+            result = run_open_loop(params, query, rate, duration, sessions, arrival)
+        else:
+            raise ValueError("Unknown driver backend: {}".format(backend))
+        summary = latency_summary(result)
+        summary["slo_p99_ms"] = slo_p99_ms
+        summary["sustainable"] = (summary["errors"] == 0
+                                  and summary["p99_ms"] is not None
+                                  and summary["p99_ms"] <= slo_p99_ms)
+        print("rate {0:.2f} qps -> p99 {1} ms ({2})".format(
+            rate, summary["p99_ms"], "ok" if summary["sustainable"] else "SLO broken"))
+        steps.append(summary)
+        return summary["sustainable"]
+
+    good, bad = 0.0, None
+    rate = start_rate
+    while rate <= max_rate:
+        if sustainable(rate):
+            good = rate
+            rate *= 2
+        else:
+            bad = rate
+            break
+    if bad is None:
+        return good, steps
+    for _ in range(bisect_steps):
+        mid = (good + bad) / 2
+        if sustainable(mid):
+            good = mid
+        else:
+            bad = mid
+    return good, steps
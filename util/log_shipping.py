@@ -0,0 +1,157 @@
+import os
+import json
+import zlib
+import shlex
+import hashlib
+
+##
+#   Incremental copy of remote log files over SSH.
+#
+#   For every remote file the byte offset already copied is kept in
+#   <local dir>/log_shipping.json, and only the bytes after it are fetched,
+#   gzipped on the server (tail -c +N | gzip) and appended to the local copy.
+#   A rotated (new inode) or truncated (smaller, or different first bytes)
+#   remote file is copied again from the start.
+#   The local copy only grows, so util.path_cost.PathCostLog(use_index=True)
+#   indexes only the new blocks.
+#   A remote file that is shipped for the last time (closed by the server)
+#   can be deleted with remove_remote, its local copy is kept.
+##
+STATE_FILE = "log_shipping.json"
+HEAD_BYTES = 4096
+CHUNK_SIZE = 1 << 16
+
+class LogShipper:
+    def __init__(self, client, local_dir: str) -> None:
+        # client : connected paramiko.SSHClient
+        self.client = client
+        self.local_dir = local_dir
+        os.makedirs(local_dir, exist_ok=True)
+        self.state_path = os.path.join(local_dir, STATE_FILE)
+        self.state = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r") as f:
+                self.state = json.load(f)
+
+    def save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=4)
+        os.replace(tmp_path, self.state_path)
+
+    def run(self, cmd: str):
+        # no pty, the output may be binary
+        stdin, stdout, stderr = self.client.exec_command(cmd)
+        out = stdout.read()
+        err = stderr.read().decode("utf-8", errors="replace")
+        status = stdout.channel.recv_exit_status()
+        return status, out, err
+
+    ##
+    #   (inode, size) of the remote file, None when it does not exist.
+    ##
+    def remote_stat(self, remote_path: str):
+        status, out, err = self.run("stat -c '%i %s' {}".format(shlex.quote(remote_path)))
+        if status != 0:
+            return None
+        inode, size = out.decode("utf-8").split()
+        return int(inode), int(size)
+
+    def remote_head_hash(self, remote_path: str, n: int):
+        status, out, err = self.run("head -c {0} {1} | sha1sum".format(n, shlex.quote(remote_path)))
+        if status != 0:
+            return None
+        return out.decode("utf-8").split()[0]
+
+    def local_path_of(self, remote_path: str):
+        return os.path.join(self.local_dir, os.path.basename(remote_path))
+
+    ##
+    #   Bytes of the remote file from offset on, decompressed as they arrive
+    #   and appended to the local file. Returns the number of bytes written,
+    #   None when the transfer failed: the local file is then truncated back
+    #   to offset, a partial chunk is never taken as shipped.
+    ##
+    def _append_from(self, remote_path: str, offset: int, local_path: str):
+        cmd = "tail -c +{0} {1} | gzip -1 -c".format(offset + 1, shlex.quote(remote_path))
+        stdin, stdout, stderr = self.client.exec_command(cmd)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        written = 0
+        error = None
+        with open(local_path, "ab") as f:
+            try:
+                while True:
+                    chunk = stdout.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    data = decompressor.decompress(chunk)
+                    f.write(data)
+                    written += len(data)
+                data = decompressor.flush()
+                f.write(data)
+                written += len(data)
+            except zlib.error as e:
+                error = str(e)
+        status = stdout.channel.recv_exit_status()
+        if status != 0:
+            error = stderr.read().decode("utf-8", errors="replace").strip() or "exit status {}".format(status)
+        elif error is None and not decompressor.eof:
+            error = "incomplete gzip stream"
+        if error is not None:
+            print("[ERROR] Fetching {0} failed : {1}".format(remote_path, error))
+            os.truncate(local_path, offset)
+            return None
+        return written
+
+    ##
+    #   Bring the local copy of the remote file up to date, return its path
+    #   (None when the remote file does not exist).
+    ##
+    def fetch(self, remote_path: str, local_path: str = None):
+        local_path = local_path or self.local_path_of(remote_path)
+        stat = self.remote_stat(remote_path)
+        if stat is None:
+            print(f"[ERROR] Remote log not found: {remote_path}")
+            return None
+        inode, size = stat
+        known = self.state.get(remote_path)
+        restart = (known is None or known["inode"] != inode or size < known["offset"]
+                   or known["local"] != local_path or not os.path.exists(local_path)
+                   or os.path.getsize(local_path) != known["offset"])
+        if not restart and known["head_len"] > 0:
+            restart = self.remote_head_hash(remote_path, known["head_len"]) != known["head"]
+        if restart:
+            if known is not None:
+                print(f"[INFO] {remote_path} was rotated or truncated, copying it again")
+            offset = 0
+            open(local_path, "wb").close()
+        else:
+            offset = known["offset"]
+        if size > offset:
+            written = self._append_from(remote_path, offset, local_path)
+            if written is None:
+                # the state still holds the last complete transfer
+                return None
+            offset += written
+            print(f"[INFO] {written} new bytes of {remote_path} shipped to {local_path}")
+        head_len = min(offset, HEAD_BYTES)
+        with open(local_path, "rb") as f:
+            head = hashlib.sha1(f.read(head_len)).hexdigest()
+        self.state[remote_path] = {"inode": inode, "offset": offset, "local": local_path,
+                                   "head": head, "head_len": head_len}
+        self.save_state()
+        return local_path
+
+    ##
+    #   Delete the remote file once its copy is no longer fed, and forget it.
+    #   Returns True when the file is gone.
+    ##
+    def remove_remote(self, remote_path: str):
+        status, out, err = self.run("rm -f {}".format(shlex.quote(remote_path)))
+        if status != 0:
+            print("[WARNING] Could not remove {0} : {1}".format(remote_path, err.strip()))
+            return False
+        self.state.pop(remote_path, None)
+        self.save_state()
+        print(f"[INFO] Removed remote log: {remote_path}")
+        return True
@@ -2,8 +2,18 @@ import os
 import json
 import re
 import shutil
-import pandas as pd
-from openpyxl import load_workbook
+import mmap
+import hashlib
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+import sys
+import csv
+import numpy as np
+from numpy.lib.recfunctions import repack_fields
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
 
 ##
 #  Create a unique directory by appending _1, _2, ... to the base path.
@@ -89,55 +99,746 @@ def parse_explain_json(file_path):
     return aliases
 
 ##
-#   Extract RELOPTINFO (ALIAS) blocks from postgresql tail log file for specified aliases.
-#   log_path:   path to the log file
-#   aliases:    set of aliases to search for
+#   Patterns of the optimizer debug output (modified pgsql_mod build).
+#   A block starts at a "RELOPTINFO (<aliases>):" line at the start of a line
+#   and runs until the next one (or the next marker line). Inside a block,
+#   the paths are listed under "path list:" / "partial path list:" headings.
+#   The marker lines "PATHCOST BEGIN|END <uuid>" (RAISE LOG of
+#   Connection.get_explain_of_query(marker=...)) bracket one measured
+#   execution. The line has to end with the uuid, so that the DO statement
+#   itself, when log_statement logs it, is not taken for a marker.
 ##
-def extract_path_info_from_log(log_path, needed_log_aliases):
-    if not os.path.exists(log_path):
-        print(f"[ERROR] Log file not found: {log_path}")
-        return {}
+RELOPTINFO_LINE_RE = re.compile(rb"^RELOPTINFO \(([^\)]*)\):")
+MARKER_LINE_RE = re.compile(rb"PATHCOST (BEGIN|END) ([0-9a-f]{32})\s*$")
+# same, over a whole file (mmap) instead of a single line
+RELOPTINFO_SCAN_RE = re.compile(rb"^RELOPTINFO \(([^\)\n]*)\):", re.MULTILINE)
+MARKER_SCAN_RE = re.compile(rb"PATHCOST (BEGIN|END) ([0-9a-f]{32})\r?$", re.MULTILINE)
+MARKER_SUFFIX = ".marker"
+SUB_RELOPTINFO_RE = re.compile(r"^RELOPTINFO \((.+?)\):")
+PATH_LIST_RE = re.compile(r"path list:")
+PARTIAL_PATH_LIST_RE = re.compile(r"partial path list:")
+CHEAPEST_PATH_HEADING_RE = re.compile(r"^cheapest .*path[s]?:", re.IGNORECASE)
+# path names printed by print_path() (allpaths.c), "<name>(<relids>) rows=.. cost=..",
+# the sub paths follow one tab deeper: outer then inner path of a join, the
+# input of the other paths that have one (Sort, Material, Gather...)
+PATH_TYPES = ("SeqScan", "SampleScan", "FunctionScan", "TableFuncScan", "ValuesScan", "CteScan",
+              "NamedTuplestoreScan", "WorkTableScan", "Result", "IdxScan", "IdxOnlyScan",
+              "BitmapHeapScan", "BitmapAndPath", "BitmapOrPath", "TidScan", "TidRangeScan",
+              "SubqueryScan", "ForeignScan", "CustomScan", "NestLoop", "MergeJoin", "HashJoin",
+              "Append", "MergeAppend", "GroupResult", "Material", "Memoize", "Unique", "Gather",
+              "GatherMerge", "Projection", "ProjectSet", "Sort", "IncrementalSort", "Group",
+              "UpperUnique", "Agg", "GroupingSets", "MinMaxAgg", "WindowAgg", "SetOp",
+              "RecursiveUnion", "LockRows", "ModifyTable", "Limit")
+JOIN_PATH_TYPES = ("NestLoop", "MergeJoin", "HashJoin")
+# the access paths of a base relation, reported in its path lists
+BASE_SCAN_TYPES = ("SeqScan", "IdxScan", "IdxOnlyScan", "BitmapHeapScan")
+PATH_TYPE_SET = frozenset(PATH_TYPES)
+# any name, the ones not in PATH_TYPES are not paths
+PATH_RE = re.compile(r"^([A-Za-z]+)\((.+?)\).*rows=(\d+).*cost=\s*([\d\.]+)\s*\.\.\s*([\d\.]+)")
+INDEX_NAME_RE = re.compile(r"index name:\s*(\S+)")
+REQUIRED_OUTER_RE = re.compile(r"required_outer\s*\(([^)]+)\)")
+# (stripped) lines the path parser reacts to, the others are not decoded
+PARSED_LINE_PREFIXES = (b"RELOPTINFO (", b"path list:", b"partial path list:", b"index name:")
+PATH_LINE_START_RE = re.compile(rb"[A-Za-z]+\(")
+
+def _is_parsed_line(stripped: bytes):
+    return (stripped.startswith(PARSED_LINE_PREFIXES) or stripped[:9].lower() == b"cheapest "
+            or PATH_LINE_START_RE.match(stripped) is not None)
+
+def _empty_path_lists():
+    return {"path_list": [], "partial_path_list": [], "parameterized_path_list": []}
 
-    with open(log_path, "r", encoding="utf-8", errors="replace") as f:
-        all_lines = f.readlines()
+##
+#   markers: uuid → [offset after the BEGIN line, offset of the END line]
+##
+def _record_marker(markers: dict, kind: bytes, marker: bytes, offset: int):
+    window = markers.setdefault(marker.decode("ascii"), [None, None])
+    window[0 if kind == b"BEGIN" else 1] = offset
+
+##
+#   Marker of the execution a plan file comes from (<sql>.marker next to
+#   <sql>.json), None for the plan files written without one.
+##
+def read_marker(json_path: str):
+    marker_path = os.path.splitext(json_path)[0] + MARKER_SUFFIX
+    if not os.path.exists(marker_path):
+        return None
+    with open(marker_path, "r") as f:
+        return f.read().strip() or None
+
+##
+#   Server log file the optimizer debug output of a plan file went to
+#   (<sql>.logname next to <sql>.json, the log_filename of its configuration),
+#   None for the plan files written without one.
+##
+LOG_NAME_SUFFIX = ".logname"
+
+def read_log_name(json_path: str):
+    log_name_path = os.path.splitext(json_path)[0] + LOG_NAME_SUFFIX
+    if not os.path.exists(log_name_path):
+        return None
+    with open(log_name_path, "r") as f:
+        return f.read().strip() or None
+
+##
+#   Fields of a parsed path: (attribute, column of the outputs)
+##
+PATH_FIELDS = [
+    ("scan_type", "Scan Type"),
+    ("index_name", "Index Name"),
+    ("rows", "Rows"),
+    ("startup_cost", "Startup Cost"),
+    ("total_cost", "Total Cost"),
+    ("required_outer", "Required Outer"),
+    ("relids", "Relation"),
+    ("outer_type", "Outer Path"),
+    ("outer_rel", "Outer Relation"),
+    ("inner_type", "Inner Path"),
+    ("inner_rel", "Inner Relation"),
+]
+_ATTRIBUTE_OF = {column: attr for attr, column in PATH_FIELDS}
+
+def _intern(value):
+    return sys.intern(value) if value is not None else None
 
-    alias_path_map = {a: [] for a in needed_log_aliases}
+##
+#   A path of the optimizer log. The strings (path types, index names,
+#   relations) are interned, a log has millions of paths but few distinct
+#   names. Also readable by column name, path["Total Cost"].
+#   outer_* / inner_*: type and relations of the outer and inner paths of a
+#   join (outer_* only: the input of a Sort, Material, Gather...)
+##
+class PathRecord:
+    __slots__ = tuple(attr for attr, column in PATH_FIELDS)
+
+    def __init__(self, scan_type, index_name, rows, startup_cost, total_cost, required_outer,
+                 relids=None) -> None:
+        self.scan_type = _intern(scan_type)
+        self.index_name = _intern(index_name)
+        self.rows = rows
+        self.startup_cost = startup_cost
+        self.total_cost = total_cost
+        self.required_outer = _intern(required_outer)
+        self.relids = _intern(relids)
+        self.outer_type = None
+        self.outer_rel = None
+        self.inner_type = None
+        self.inner_rel = None
+
+    def add_sub_path(self, path):
+        if self.outer_type is None:
+            self.outer_type, self.outer_rel = path.scan_type, path.relids
+        elif self.inner_type is None:
+            self.inner_type, self.inner_rel = path.scan_type, path.relids
+
+    def __getitem__(self, column):
+        return getattr(self, _ATTRIBUTE_OF[column])
+
+    def get(self, column, default=None):
+        attr = _ATTRIBUTE_OF.get(column)
+        return getattr(self, attr) if attr is not None else default
+
+    def astuple(self):
+        return tuple(getattr(self, attr) for attr in self.__slots__)
+
+    def as_dict(self):
+        return {column: getattr(self, attr) for attr, column in PATH_FIELDS}
+
+    def __eq__(self, other):
+        return isinstance(other, PathRecord) and self.astuple() == other.astuple()
+
+    def __repr__(self):
+        return "PathRecord{}".format(self.astuple())
+
+##
+#   One RELOPTINFO block of the log: its aliases, where it is in the file
+#   (byte offset and length) and the paths parsed from it.
+#   segments: [(aliases inside the parentheses, [(list key, scan path), ...],
+#   [(list key, path), ...])], one per RELOPTINFO line of the block (a single
+#   one in practice). The scan paths are all the access paths of the lists,
+#   sub paths included, as reported for a base relation. The second list
+#   holds the paths of the lists themselves (of any type, with their sub
+#   paths), as reported for a join relation.
+##
+class RelOptBlock:
+    def __init__(self, aliases: str, offset: int) -> None:
+        self.aliases = aliases
+        self.search_aliases = tuple(get_log_search_alias(a) for a in aliases.split())
+        self.offset = offset
+        self.length = 0
+        self.segments = []
+        self.list_type = None
+        self.last_path = None
+        # (depth, path) of the paths the next deeper line can be a sub path of
+        self.open_paths = []
+
+    def _reset(self):
+        self.list_type = None
+        self.last_path = None
+        self.open_paths = []
+
+    ##
+    #   Parse one line of the block (as in the log, the tabs in front of a
+    #   path give its depth). The paths are kept both ways, whether the block
+    #   is a base or a join relation is decided by its alias (see
+    #   PathCostLog.path_data and PathCostLog.join_path_data).
+    ##
+    def feed(self, line: str):
+        depth = len(line) - len(line.lstrip("\t"))
+        line = line.strip()
+        if not line:
+            return
+        # the cheap prefix tests first, most lines are paths
+        sub_rel_match = SUB_RELOPTINFO_RE.match(line) if line.startswith("RELOPTINFO (") else None
+        if sub_rel_match:
+            self.segments.append((sub_rel_match.group(1), [], []))
+            self._reset()
+            return
+        if not self.segments:
+            return
+        if line.startswith("path list:"):
+            self._reset()
+            self.list_type = "path_list"
+            return
+        if line.startswith("partial path list:"):
+            self._reset()
+            self.list_type = "partial_path_list"
+            return
+        # If we encounter a line that indicates the cheapest path, we stop collecting paths
+        if line[:9].lower() == "cheapest " and CHEAPEST_PATH_HEADING_RE.match(line):
+            self._reset()
+            return
+        inner_alias, paths, rel_paths = self.segments[-1]
+        path_match = PATH_RE.match(line)
+        if path_match and path_match.group(1) in PATH_TYPE_SET:
+            scan_type, table, rows, startup_cost, total_cost = path_match.groups()
+            ro_match = REQUIRED_OUTER_RE.search(line)
+            required_outer = ro_match.group(1) if ro_match else None
+            try:
+                rows = int(rows)
+                startup_cost = float(startup_cost)
+                total_cost = float(total_cost)
+            except ValueError:
+                print(f"[ERROR] Skipping invalid cost values: {startup_cost}..{total_cost}")
+                return
+            path = PathRecord(scan_type, None, rows, startup_cost, total_cost, required_outer, relids=table)
+            list_key = "parameterized_path_list" if required_outer else self.list_type
+            self._add_to_tree(path, depth, list_key, rel_paths)
+            if scan_type not in BASE_SCAN_TYPES:
+                return
+            if inner_alias == "TABLE_ITEMS" and table != "TABLE_ITEMS":
+                return
+            if list_key is None:
+                return            # No path list type found, skip this line
+            paths.append((list_key, path))
+            self.last_path = path
+            return
+        index_name_match = INDEX_NAME_RE.match(line)
+        if index_name_match and self.last_path:
+            self.last_path.index_name = sys.intern(index_name_match.group(1))
+
+    ##
+    #   A path of a list (the least indented under its heading), or the sub
+    #   path of the open path one tab less indented.
+    ##
+    def _add_to_tree(self, path, depth, list_key, rel_paths):
+        while self.open_paths and self.open_paths[-1][0] >= depth:
+            self.open_paths.pop()
+        if self.open_paths:
+            if self.open_paths[-1][0] == depth - 1:
+                self.open_paths[-1][1].add_sub_path(path)
+        elif self.list_type is not None:
+            rel_paths.append((list_key, path))
+        else:
+            return            # under a "cheapest" heading, already listed
+        self.open_paths.append((depth, path))
 
-    current_log_alias = None
-    collecting = False
+    def close(self, end_offset: int):
+        self.length = end_offset - self.offset
+        self._reset()
 
-    pattern = re.compile(r'^RELOPTINFO \(([^\)]*)\):')
+##
+#   Add the paths of the blocks of an alias to data (table → path lists).
+#   Only the blocks of the base relation itself count: not the join
+#   relations (a space between the aliases) nor the partition children.
+#   The TABLE_ITEMS_<n> aliases are reported under TABLE_ITEMS.
+##
+def add_base_paths(data: dict, alias: str, blocks):
+    table = "TABLE_ITEMS" if alias.startswith("TABLE_ITEMS_") else alias
+    lists = data.setdefault(table, _empty_path_lists())
+    for block in blocks:
+        for inner_alias, paths, rel_paths in block.segments:
+            if inner_alias != table or " " in inner_alias:
+                continue
+            for list_key, path in paths:
+                lists[list_key].append(path)
+    return data
 
-    for line in all_lines:
-        match = pattern.match(line)
-        if match:
-            collecting = False
-            current_log_alias = None
+##
+#   Parse a block read from the log (its bytes, starting at its RELOPTINFO line).
+##
+def parse_block_bytes(data: bytes, offset: int):
+    lines = data.split(b"\n")
+    match = RELOPTINFO_LINE_RE.match(lines[0])
+    block = RelOptBlock(match.group(1).decode("utf-8", errors="replace").strip() if match else "", offset)
+    for raw in lines:
+        if _is_parsed_line(raw.strip()):
+            block.feed(raw.decode("utf-8", errors="replace"))
+    block.close(offset + len(data))
+    return block
+
+INDEX_SUFFIX = ".relidx"
+INDEX_HEAD_BYTES = 4096
+INDEX_VERSION = 2
 
-            inside = match.group(1).strip()
-            inside_aliases = inside.split()
+##
+#   Sidecar index of the RELOPTINFO blocks of a log, <log>.relidx (numpy npz):
+#     • "a:<alias>" → int64 rows (byte offset, length, rank) of every block
+#       where the alias appears, rank being its position in the block's
+#       alias list (a block goes to its first needed alias)
+#     • "meta" → JSON: inode, indexed size, hash of the first bytes of the
+#       file, the offset the next update resumes from (start of the last block,
+#       which may still be growing) and the execution markers found
+#   The index is extended when the log grows, and rebuilt when the log was
+#   truncated or replaced. A lookup only loads the arrays of the needed aliases.
+##
+class RelOptIndex:
+    def __init__(self, log_path: str) -> None:
+        self.log_path = log_path
+        self.index_path = log_path + INDEX_SUFFIX
+        self.meta = None
+        self.npz = None
+
+    def _head_hash(self, f, n):
+        f.seek(0)
+        return hashlib.sha1(f.read(n)).hexdigest()
+
+    def _load(self):
+        if self.npz is not None:
+            self.npz.close()
+            self.npz = None
+        self.meta = None
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            self.npz = np.load(self.index_path)
+            self.meta = json.loads(str(self.npz["meta"]))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[WARNING] Unreadable index {self.index_path}, rebuilding it: {e}")
+            self.npz = None
+            self.meta = None
+
+    ##
+    #   Bring the index up to date with the log, return the number of blocks
+    #   scanned (the last block of the previous update is scanned again).
+    ##
+    def update(self):
+        self._load()
+        st = os.stat(self.log_path)
+        with open(self.log_path, "rb") as f:
+            meta = self.meta
+            # same file (inode), not shorter, and same first bytes as when indexed
+            valid = (meta is not None and meta.get("version") == INDEX_VERSION
+                     and meta["inode"] == st.st_ino and st.st_size >= meta["size"]
+                     and self._head_hash(f, meta["head_len"]) == meta["head"])
+            if valid and st.st_size == meta["size"]:
+                return 0
+            kept = {}
+            entries = {}
+            markers = {}
+            resume = 0
+            if valid:
+                resume = meta["resume"]
+                markers = meta["markers"]
+                # the blocks before the resume point are complete, keep them
+                for key in self.npz.files:
+                    if key.startswith("a:"):
+                        rows = self.npz[key]
+                        kept[key[2:]] = rows[rows[:, 0] < resume]
+            elif meta is not None:
+                print(f"[INFO] {self.log_path} was truncated or replaced, rebuilding its index")
+            n_blocks, resume = self._scan(f, resume, st.st_size, entries, markers)
+            head_len = min(st.st_size, INDEX_HEAD_BYTES)
+            head = self._head_hash(f, head_len)
+        self._save(kept, entries, markers, st, head, head_len, resume)
+        return n_blocks
+
+    def _scan(self, f, start, size, entries, markers):
+        if size == 0:
+            return 0, 0
+        n_blocks = 0
+        last_start = None
+        with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+            previous = None
+            # the markers are few, a separate scan keeps the RELOPTINFO one fast
+            marker_matches = list(MARKER_SCAN_RE.finditer(mm, start, size))
+            boundaries = RELOPTINFO_SCAN_RE.finditer(mm, start, size)
+            if marker_matches:
+                boundaries = heapq.merge(boundaries, marker_matches, key=lambda m: m.start())
+            for match in boundaries:
+                line_start = mm.rfind(b"\n", 0, match.start()) + 1
+                if previous is not None:
+                    self._add(entries, previous[0], line_start - previous[0], previous[1])
+                    n_blocks += 1
+                    previous = None
+                if match.re is RELOPTINFO_SCAN_RE:
+                    previous = (match.start(), match.group(1))
+                elif match.group(1) == b"BEGIN":
+                    line_end = mm.find(b"\n", match.end(), size)
+                    _record_marker(markers, b"BEGIN", match.group(2), size if line_end < 0 else line_end + 1)
+                else:
+                    _record_marker(markers, b"END", match.group(2), line_start)
+            if previous is not None:
+                self._add(entries, previous[0], size - previous[0], previous[1])
+                n_blocks += 1
+                last_start = previous[0]
+            else:
+                # no block after start: resume from the last (maybe partial) line
+                last_start = max(start, mm.rfind(b"\n", start, size) + 1)
+        return n_blocks, last_start
+
+    def _add(self, entries, offset, length, raw_aliases):
+        aliases = raw_aliases.decode("utf-8", errors="replace").strip().split()
+        seen = set()
+        for rank, alias in enumerate(aliases):
+            search_alias = get_log_search_alias(alias)
+            if search_alias in seen:
+                continue
+            seen.add(search_alias)
+            entries.setdefault(search_alias, []).append((offset, length, rank))
+
+    def _save(self, kept, entries, markers, st, head, head_len, resume):
+        self.meta = {"version": INDEX_VERSION, "inode": st.st_ino, "size": st.st_size, "head": head,
+                     "head_len": head_len, "resume": resume, "markers": markers}
+        arrays = {}
+        for alias in set(kept) | set(entries):
+            rows = [kept.get(alias, np.empty((0, 3), dtype=np.int64)),
+                    np.array(entries.get(alias, []), dtype=np.int64).reshape(-1, 3)]
+            arrays["a:" + alias] = np.concatenate(rows)
+        arrays["meta"] = np.array(json.dumps(self.meta))
+        if self.npz is not None:
+            self.npz.close()
+            self.npz = None
+        # per process: the workers of output_path_cost_info may update it at once
+        tmp_path = "{0}.{1}.tmp".format(self.index_path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, self.index_path)
+        self.npz = np.load(self.index_path)
+
+    def markers(self):
+        return self.meta["markers"]
+
+    ##
+    #   (offset, length) of the blocks of every needed alias, in log order.
+    #   A block goes to the needed alias coming first in its alias list.
+    #   window: (begin, end) byte range the blocks have to start in
+    ##
+    def lookup(self, needed_log_aliases, window=None):
+        owner = {}
+        for alias in needed_log_aliases:
+            key = "a:" + alias
+            if key not in self.npz.files:
+                continue
+            rows = self.npz[key]
+            if window is not None:
+                rows = rows[(rows[:, 0] >= window[0]) & (rows[:, 0] < window[1])]
+            for offset, length, rank in rows.tolist():
+                if offset not in owner or rank < owner[offset][0]:
+                    owner[offset] = (rank, alias, length)
+        located = {a: [] for a in needed_log_aliases}
+        for offset in sorted(owner):
+            rank, alias, length = owner[offset]
+            located[alias].append((offset, length))
+        return located
+
+    def close(self):
+        if self.npz is not None:
+            self.npz.close()
+            self.npz = None
 
-            for inside_alias in inside_aliases:
-                norm_alias = get_log_search_alias(inside_alias)
-                if norm_alias in needed_log_aliases:
-                    current_log_alias = norm_alias
-                    collecting = True
-                    alias_path_map[current_log_alias].append(line.rstrip('\n'))
+##
+#   All the RELOPTINFO blocks of a PostgreSQL log, parsed in one streaming
+#   pass over the file (read in binary, only the lines the parser needs are
+#   decoded). Every query is then served from the parsed blocks, the log is
+#   only read again to copy the text of the blocks it needs.
+##
+class PathCostLog:
+    def __init__(self, log_path: str, use_index: bool = False) -> None:
+        self.log_path = log_path
+        self.blocks = []
+        # with use_index, the blocks are located through <log>.relidx and
+        # only the ones a query needs are read and parsed (kept by offset)
+        self.index = None
+        self.loaded = {}
+        self.markers = {}
+        if use_index:
+            self.index = RelOptIndex(log_path)
+            new_blocks = self.index.update()
+            if new_blocks:
+                print(f"[INFO] {new_blocks} RELOPTINFO blocks scanned into {self.index.index_path}")
+        else:
+            self.parse()
+
+    def parse(self):
+        block = None
+        offset = 0
+        with open(self.log_path, "rb") as f:
+            for raw in f:
+                marker = MARKER_LINE_RE.search(raw) if b"PATHCOST" in raw else None
+                if marker:
+                    if block is not None:
+                        block.close(offset)
+                        block = None
+                    kind, uuid = marker.groups()
+                    _record_marker(self.markers, kind, uuid, offset + len(raw) if kind == b"BEGIN" else offset)
+                    offset += len(raw)
+                    continue
+                match = RELOPTINFO_LINE_RE.match(raw)
+                if match:
+                    if block is not None:
+                        block.close(offset)
+                    block = RelOptBlock(match.group(1).decode("utf-8", errors="replace").strip(), offset)
+                    self.blocks.append(block)
+                if block is not None:
+                    if _is_parsed_line(raw.strip()):
+                        block.feed(raw.decode("utf-8", errors="replace"))
+                offset += len(raw)
+        if block is not None:
+            block.close(offset)
+        return self.blocks
+
+    # the BEGIN marker is in the log
+    def has_marker(self, marker):
+        markers = self.index.markers() if self.index is not None else self.markers
+        return markers.get(marker, [None, None])[0] is not None
+
+    ##
+    #   (begin, end) byte range of the execution bracketed by the marker.
+    #   None (the whole log) when the marker is not in the log.
+    ##
+    def window(self, marker):
+        markers = self.index.markers() if self.index is not None else self.markers
+        begin, end = markers.get(marker, [None, None])
+        if begin is None:
+            print(f"[WARNING] Marker {marker} not found in {self.log_path}, using the whole log")
+            return None
+        if end is None:
+            print(f"[WARNING] No end marker for {marker} in {self.log_path}, reading up to the end of the log")
+            end = os.path.getsize(self.log_path)
+        return begin, end
+
+    ##
+    #   Blocks of every needed alias, in log order. A block goes to the first
+    #   of its aliases that is needed (a join block goes to one alias only).
+    #   marker: only the blocks of the execution bracketed by this marker
+    ##
+    def blocks_by_alias(self, needed_log_aliases, marker=None):
+        window = self.window(marker) if marker is not None else None
+        if self.index is not None:
+            return self._indexed_blocks_by_alias(needed_log_aliases, window)
+        alias_blocks = {a: [] for a in needed_log_aliases}
+        for block in self.blocks:
+            if window is not None and not window[0] <= block.offset < window[1]:
+                continue
+            for search_alias in block.search_aliases:
+                if search_alias in needed_log_aliases:
+                    alias_blocks[search_alias].append(block)
                     break
+        return alias_blocks
+
+    def _indexed_blocks_by_alias(self, needed_log_aliases, window=None):
+        alias_blocks = {}
+        with open(self.log_path, "rb") as f:
+            for alias, located in self.index.lookup(needed_log_aliases, window).items():
+                alias_blocks[alias] = []
+                for offset, length in located:
+                    if offset not in self.loaded:
+                        f.seek(offset)
+                        self.loaded[offset] = parse_block_bytes(f.read(length), offset)
+                    alias_blocks[alias].append(self.loaded[offset])
+        return alias_blocks
+
+    def read_block_lines(self, f, block: RelOptBlock):
+        f.seek(block.offset)
+        text = f.read(block.length).decode("utf-8", errors="replace")
+        # same lines as a text mode read (universal newlines)
+        lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        if lines and lines[-1] == "":
+            lines.pop()
+        return lines
+
+    ##
+    #   Text of the blocks of every needed alias: alias → list of lines.
+    ##
+    def extract_lines(self, needed_log_aliases, marker=None):
+        alias_path_map = {}
+        with open(self.log_path, "rb") as f:
+            for alias, blocks in self.blocks_by_alias(needed_log_aliases, marker).items():
+                alias_path_map[alias] = [l for block in blocks for l in self.read_block_lines(f, block)]
+        return alias_path_map
+
+    ##
+    #   Paths of the base relations of the needed aliases:
+    #   table → {"path_list", "partial_path_list", "parameterized_path_list"}.
+    ##
+    def path_data(self, needed_log_aliases, marker=None):
+        data = {}
+        alias_blocks = self.blocks_by_alias(needed_log_aliases, marker)
+        for alias in sorted(alias_blocks):
+            if alias_blocks[alias]:
+                add_base_paths(data, alias, alias_blocks[alias])
+        return data
+
+    ##
+    #   Paths of the join relations of the needed aliases (the blocks with a
+    #   space between their aliases), with their outer and inner paths:
+    #   join relation → {"path_list", "partial_path_list", "parameterized_path_list"}.
+    ##
+    def join_path_data(self, needed_log_aliases, marker=None):
+        data = {}
+        alias_blocks = self.blocks_by_alias(needed_log_aliases, marker)
+        for alias in sorted(alias_blocks):
+            for block in alias_blocks[alias]:
+                for inner_alias, paths, rel_paths in block.segments:
+                    if " " not in inner_alias:
+                        continue
+                    lists = data.setdefault(inner_alias, _empty_path_lists())
+                    for list_key, path in rel_paths:
+                        lists[list_key].append(path)
+        return data
+
+    ##
+    #   Write the blocks of the needed aliases as <sql>_pathcost.txt.
+    ##
+    def write_pathcost_txt(self, txt_path, needed_log_aliases, marker=None):
+        alias_blocks = self.blocks_by_alias(needed_log_aliases, marker)
+        with open(self.log_path, "rb") as f, open(txt_path, "w", encoding="utf-8") as outf:
+            # Only write the aliases that are in the log file
+            for parent in sorted(alias_blocks):
+                if not alias_blocks[parent]:
+                    continue
+                outf.write(f"===== RELOPTINFO for alias: {parent} =====\n")
+                for block in alias_blocks[parent]:
+                    outf.writelines(l + "\n" for l in self.read_block_lines(f, block))
+                outf.write("\n")
+
+    def close(self):
+        if self.index is not None:
+            self.index.close()
+
+##
+#   Extract RELOPTINFO (ALIAS) blocks from postgresql tail log file for specified aliases.
+#   log_path:   path to the log file (or an already parsed PathCostLog)
+#   aliases:    set of aliases to search for
+#   marker:     only the blocks of the execution bracketed by this marker
+##
+def extract_path_info_from_log(log_path, needed_log_aliases, marker=None):
+    if isinstance(log_path, PathCostLog):
+        return log_path.extract_lines(needed_log_aliases, marker)
+    if not os.path.exists(log_path):
+        print(f"[ERROR] Log file not found: {log_path}")
+        return {}
+    # seek straight to the blocks through the <log>.relidx index
+    return PathCostLog(log_path, use_index=True).extract_lines(needed_log_aliases, marker)
+
+LOG_REF_SUFFIX = ".ref"
+
+##
+#   Reference to the shared log instead of a copy of it next to the outputs
+#   of a query: <sql>_<log name>.ref (JSON), with the path and size of the
+#   log and the marker / byte window of the execution.
+##
+def write_log_reference(target_dir: str, sql_name: str, path_log: PathCostLog, marker=None):
+    ref = {"log": os.path.abspath(path_log.log_path),
+           "size": os.path.getsize(path_log.log_path),
+           "marker": marker,
+           "window": path_log.window(marker) if marker is not None else None}
+    ref_path = os.path.join(target_dir, f"{sql_name}_{os.path.basename(path_log.log_path)}{LOG_REF_SUFFIX}")
+    with open(ref_path, "w") as f:
+        json.dump(ref, f, indent=4)
+    return ref_path
 
-        elif collecting and current_log_alias:
-            alias_path_map[current_log_alias].append(line.rstrip('\n'))
+##
+#   Path cost outputs of one query: <sql>_pathcost.txt and
+#   <sql>_path_cost_info.xlsx in target_dir, and <sql>_path_cost.<csv|parquet>
+#   with table_format. Returns the Excel path, None when the log has no
+#   block for the query.
+##
+def write_query_path_cost(path_log: PathCostLog, sql_name: str, json_path: str, target_dir: str,
+                          table_format=None):
+    # Analyze the JSON file
+    aliases = parse_explain_json(json_path)
+    needed = {get_log_search_alias(a) for a in aliases}
+    # only the blocks of the execution the plan comes from, when it was marked
+    marker = read_marker(json_path)
+
+    # debug message
+    # print("[DEBUG] needed =", needed)
+
+    # Output path cost information to a text file
+    txt_path = os.path.join(target_dir, f"{sql_name}_pathcost.txt")
+    path_log.write_pathcost_txt(txt_path, needed, marker)
+
+    data = path_log.path_data(needed, marker)
+    if not data:
+        print(f"[WARNING] No RELOPTINFO block found in the log for {sql_name}")
+        return None
+
+    # Convert the parsed paths to Excel
+    xlsx_path = os.path.join(
+        target_dir, f"{sql_name}_path_cost_info.xlsx")
+    write_path_cost_excel(data, xlsx_path)
+
+    print(f"[INFO] Excel file has been saved to: {xlsx_path}")
+    if table_format is not None:
+        table_path = os.path.join(target_dir, f"{sql_name}_path_cost.{table_format}")
+        write_path_cost_table(data, table_path, table_format)
+
+    # the join orders and methods considered, and how far they are from the cheapest
+    join_data = path_log.join_path_data(needed, marker)
+    if join_data:
+        join_xlsx_path = os.path.join(target_dir, f"{sql_name}_join_path_cost.xlsx")
+        write_join_path_excel(join_data, join_xlsx_path)
+        print(f"[INFO] Join paths of {len(join_data)} join relations saved to: {join_xlsx_path}")
+    return xlsx_path
+
+# logs opened by a worker process, reused for its next jobs
+_worker_logs = {}
+
+def _path_cost_worker(log_path: str, sql_name: str, json_path: str, target_dir: str, table_format=None):
+    if log_path not in _worker_logs:
+        # the index was brought up to date by the parent, opening it is cheap
+        _worker_logs[log_path] = PathCostLog(log_path, use_index=True)
+    return write_query_path_cost(_worker_logs[log_path], sql_name, json_path, target_dir, table_format)
 
-    return alias_path_map
+##
+#   Write the outputs of every job (sql_name, json_path, target_dir) from the
+#   shared log, in a pool of worker processes (workers: pool size, None for
+#   the number of CPUs, 1 to stay in this process). The workers share the
+#   log through its .relidx index. Returns the Excel paths in job order.
+#   table_format: "csv" or "parquet" to also write the paths as a table
+##
+def run_path_cost_jobs(path_log: PathCostLog, jobs, workers=None, table_format=None):
+    if workers == 1 or len(jobs) <= 1 or path_log.index is None:
+        return [write_query_path_cost(path_log, *job, table_format=table_format) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_path_cost_worker, path_log.log_path, *job, table_format)
+                   for job in jobs]
+        return [future.result() for future in futures]
 
 ##
 #   Output path cost information to a text file and convert it to Excel.
 ##
 def output_path_cost_info(folder_path: str,
                           log_filename: str,
-                          keep_in_place: bool = False):
-    # If keep_in_place is True, the log file should already be in the folder_path.
-    # Otherwise, it will be copied to the new directory.
+                          keep_in_place: bool = False,
+                          path_log: PathCostLog = None,
+                          workers=None,
+                          table_format=None):
+    # If keep_in_place is True, the outputs are written next to the JSON files.
+    # Otherwise, every JSON file gets its own directory, with a reference
+    # to the log (see write_log_reference) instead of a copy of it.
     log_path = os.path.join(folder_path, log_filename)
     if not os.path.exists(log_path):
         print(f"[ERROR] Unable to find log file: {log_path}")
@@ -148,15 +849,12 @@ def output_path_cost_info(folder_path: str,
         print(f"[WARNING] No .json files in {folder_path}")
         return
 
-    # Retrieve all aliases from the log file
-    all_aliases_from_log = set()
-    with open(log_path, "r", encoding="utf-8") as lf:
-        for line in lf:
-            m = re.match(r"^RELOPTINFO \(([^\)]*)\):", line)
-            if m:
-                parts = m.group(1).split()
-                all_aliases_from_log.update(get_log_search_alias(p) for p in parts)
+    # the log is indexed once (<log>.relidx), every query only reads its blocks
+    # (path_log: the log already opened by the caller)
+    if path_log is None:
+        path_log = PathCostLog(log_path, use_index=True)
 
+    jobs = []
     for jf in json_files:
         sql_name = os.path.splitext(jf)[0]
 
@@ -166,46 +864,24 @@ def output_path_cost_info(folder_path: str,
         else:
             target_dir = make_unique_dir(os.path.join(folder_path, sql_name))
 
-        # path to the JSON and log files
+        # path to the JSON file
         json_src  = os.path.join(folder_path, jf)
         json_dst  = os.path.join(target_dir, jf)
-        log_dst   = os.path.join(target_dir, f"{sql_name}_{log_filename}")
 
         if not keep_in_place:
             shutil.copyfile(json_src, json_dst)
-            shutil.copyfile(log_path, log_dst)
+            marker = read_marker(json_src)
+            if marker is not None:
+                shutil.copyfile(os.path.splitext(json_src)[0] + MARKER_SUFFIX,
+                                os.path.splitext(json_dst)[0] + MARKER_SUFFIX)
+            write_log_reference(target_dir, sql_name, path_log, marker)
         else:
             # If keep_in_place, we need to use the original log file and the JSON file in the same folder
             json_dst = json_src
-            log_dst  = os.path.join(folder_path, log_filename)
-
-        # Analyze the JSON file
-        aliases = parse_explain_json(json_dst) 
-        needed = {get_log_search_alias(a) for a in aliases}
-        
-        # debug message
-        # print("[DEBUG] needed =", needed)
-        
-        alias_path_map = extract_path_info_from_log(log_dst, needed)
-
-        # Output path cost information to a text file
-        txt_path = os.path.join(target_dir, f"{sql_name}_pathcost.txt")
-        with open(txt_path, "w", encoding="utf-8") as outf:
-            # Only write the aliases that are in the log file
-            for parent in sorted(alias_path_map):
-                lines = alias_path_map[parent]
-                if not lines:
-                    continue
-                outf.write(f"===== RELOPTINFO for alias: {parent} =====\n")
-                outf.writelines(l + "\n" for l in lines)
-                outf.write("\n")
 
-        # Convert the text file to Excel
-        xlsx_path = os.path.join(
-            target_dir, f"{sql_name}_path_cost_info.xlsx")
-        convert_pathcost_file_to_excel(txt_path, xlsx_path)
+        jobs.append((sql_name, json_dst, target_dir))
 
-        print(f"[INFO] Excel file has been saved to: {xlsx_path}")
+    run_path_cost_jobs(path_log, jobs, workers, table_format)
 
 ##
 #   Extract partition ID from the path cost information
@@ -215,207 +891,278 @@ def _partition_id(path):#
     m = PART_RE.search(path.get("Index Name") or "")
     return m.group(1) if m else None
 
+PATH_KEY_COLUMNS = ("Scan Type", "Index Name", "Rows", "Startup Cost", "Total Cost")
+# the strings are stored as codes into PathTable.names, -1 for None
+PATH_DTYPE = np.dtype([
+    ("scan_type", np.int32),
+    ("index_name", np.int32),
+    ("rows", np.int64),
+    ("startup_cost", np.float64),
+    ("total_cost", np.float64),
+    ("required_outer", np.int32),
+    ("outer_type", np.int32),
+    ("outer_rel", np.int32),
+    ("inner_type", np.int32),
+    ("inner_rel", np.int32),
+])
+# the sub paths tell apart the join orders and methods with the same costs
+PATH_KEY_FIELDS = ["scan_type", "index_name", "rows", "startup_cost", "total_cost",
+                   "outer_type", "outer_rel", "inner_type", "inner_rel"]
+
 ##
-#   Insert blank lines between partitions in the path cost information
+#   The paths of a list as a numpy structured array, for the vectorized
+#   dedup, partition grouping and sorting. The records stay in self.paths,
+#   the methods return positions into it.
 ##
-def insert_blank_between_partitions(paths):
-    # Remove duplicates
-    uniq, seen = [], set()
-    for p in paths:
-        key = (p["Scan Type"], p["Index Name"],
-               p["Rows"], p["Startup Cost"], p["Total Cost"])
-        if key not in seen:
-            seen.add(key)
-            uniq.append(p)
-
-    result     = []
-    last_part  = None
-
-    for i, p in enumerate(uniq):
-        this_part = _partition_id(p)
-
-        # If this_part is None and the previous one is not, set it to the last one
-        if this_part is None and p["Scan Type"] == "SeqScan":
-            if i + 1 < len(uniq):
-                this_part = _partition_id(uniq[i + 1]) or last_part
-            else:
-                this_part = last_part
+class PathTable:
+    def __init__(self, paths) -> None:
+        self.paths = paths if isinstance(paths, list) else list(paths)
+        self.codes = {}
+        self.names = []
+        self.array = np.array([(self.code(p.scan_type), self.code(p.index_name), p.rows,
+                                p.startup_cost, p.total_cost, self.code(p.required_outer),
+                                self.code(p.outer_type), self.code(p.outer_rel),
+                                self.code(p.inner_type), self.code(p.inner_rel))
+                               for p in self.paths], dtype=PATH_DTYPE)
+
+    def code(self, name):
+        if name is None:
+            return -1
+        if name not in self.codes:
+            self.codes[name] = len(self.names)
+            self.names.append(name)
+        return self.codes[name]
+
+    def name(self, code):
+        return self.names[code] if code >= 0 else None
+
+    ##
+    #   Positions of the paths without their duplicates (same scan, index,
+    #   rows and costs), the first of each, in their order.
+    ##
+    def unique_positions(self):
+        if len(self.array) == 0:
+            return np.empty(0, dtype=np.int64)
+        keys = repack_fields(self.array[PATH_KEY_FIELDS])
+        _, first = np.unique(keys, return_index=True)
+        return np.sort(first)
+
+    ##
+    #   Partition code (of the name, see _partition_id) of the paths at the
+    #   positions, -1 for none. The regex runs once per distinct index name.
+    ##
+    def partition_codes(self, positions):
+        index_codes = self.array["index_name"][positions]
+        lookup = np.full(len(self.names) + 1, -1, dtype=np.int32)
+        for index_code in np.unique(index_codes[index_codes >= 0]).tolist():
+            lookup[index_code] = self.code(_partition_id({"Index Name": self.names[index_code]}))
+        # code -1 (no index) reads the last entry, -1
+        return lookup[index_codes]
+
+    ##
+    #   Unique positions and where the blank lines between partitions go
+    #   (blank_before[i]: a blank line before the i-th one). A sequential scan
+    #   has no partition in its name, it goes with the next path, or else the
+    #   previous one.
+    ##
+    def partition_blanks(self):
+        positions = self.unique_positions()
+        n = len(positions)
+        parts = self.partition_codes(positions)
+        seq_scan = self.array["scan_type"][positions] == self.codes.get("SeqScan", -2)
+        following = np.full(n, -1, dtype=np.int32)
+        following[:-1] = parts[1:]
+        guess = seq_scan & (parts == -1)
+        resolved = np.where(guess, following, parts)
+        # no next partition either: the one of the last path that has its own
+        carried = guess & (following == -1)
+        source = np.maximum.accumulate(np.where(carried, -1, np.arange(n)))
+        resolved = np.where(source >= 0, resolved[np.maximum(source, 0)], -1)
+        blank_before = np.zeros(n, dtype=bool)
+        blank_before[1:] = (resolved[:-1] != -1) & (resolved[1:] != resolved[:-1])
+        return positions, blank_before, resolved
+
+    ##
+    #   The positions ordered by total cost, then startup cost.
+    ##
+    def cost_order(self, positions=None):
+        if positions is None:
+            positions = np.arange(len(self.array))
+        selected = self.array[positions]
+        return positions[np.lexsort((selected["startup_cost"], selected["total_cost"]))]
 
+##
+#   Insert blank lines between partitions in the path cost information
+##
+def iter_blank_between_partitions(paths):
+    table = PathTable(paths)
+    positions, blank_before, parts = table.partition_blanks()
+    for position, blank in zip(positions.tolist(), blank_before.tolist()):
         # Determine if we need to insert a blank line
-        if last_part is not None and this_part != last_part:
-            result.append({
+        if blank:
+            yield {
                 "Scan Type": None, "Index Name": None,
                 "Rows": None, "Startup Cost": None, "Total Cost": None
-            })
-
-        result.append(p)
-        last_part = this_part
-
-    return result
+            }
+        yield table.paths[position]
 
 ##
-#   Convert the path cost information text file to an Excel file.
+#   The list form of iter_blank_between_partitions. Nothing in the tree calls
+#   it any more; it is kept as public API for the scripts that import it.
 ##
-def convert_pathcost_file_to_excel(input_file, output_excel):
-    with open(input_file, "r", encoding="utf-8") as f:
-        lines = f.readlines()
+def insert_blank_between_partitions(paths):
+    return list(iter_blank_between_partitions(paths))
 
+##
+#   Parse a <sql>_pathcost.txt file (see PathCostLog.write_pathcost_txt)
+#   back into table → path lists.
+##
+def parse_pathcost_txt(input_file):
     reloptinfo_pattern = re.compile(r"^===== RELOPTINFO for alias: (.+?) =====$")
-    path_list_pattern = re.compile(r"path list:")
-    partial_path_list_pattern = re.compile(r"partial path list:")
-    path_pattern = re.compile(
-        r"^(IdxScan|SeqScan)\((.+?)\).*rows=(\d+).*cost=\s*([\d\.]+)\s*\.\.\s*([\d\.]+)"
-    )
-    index_name_pattern = re.compile(r"index name:\s*(\S+)")
-    required_outer_pattern = re.compile(r"required_outer\s*\(([^)]+)\)")
-    
-    sub_reloptinfo_pattern     = re.compile(r"^RELOPTINFO \((.+?)\):")
-    inside_base_relopt         = True   # If inside base reloptinfo, we can collect path info
-    
-    cheapest_path_heading = re.compile(r"^cheapest .*path[s]?:", re.IGNORECASE)
-
-
+    sections = []
+    with open(input_file, "r", encoding="utf-8") as f:
+        for line in f:
+            reloptinfo_match = reloptinfo_pattern.match(line.strip())
+            if reloptinfo_match:
+                # the whole section goes through one block parser
+                sections.append((reloptinfo_match.group(1), RelOptBlock("", 0)))
+            elif sections:
+                sections[-1][1].feed(line)
     data = {}
-    current_alias = None
-    current_list_type = None
-    last_path = None
-
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-
-        reloptinfo_match = reloptinfo_pattern.match(line)
-        if reloptinfo_match:
-            alias = reloptinfo_match.group(1)
-            if alias.startswith("TABLE_ITEMS_"):
-                current_alias = "TABLE_ITEMS"
-            else:
-                current_alias = alias
-                
-            inside_base_relopt = True
-
-            if current_alias not in data:
-                data[current_alias] = {
-                    "path_list": [],
-                    "partial_path_list": [],
-                    "parameterized_path_list": []
-                }
-            current_list_type = None
-            last_path = None
-            continue
-        
-        sub_rel_match = sub_reloptinfo_pattern.match(line)
-        if sub_rel_match:
-            inner_alias = sub_rel_match.group(1)
+    for alias, block in sections:
+        add_base_paths(data, alias, [block])
+    return data
 
-            # When there is a space inside the parentheses, it indicates a join RelOptInfo
-            inside_base_relopt = (inner_alias == current_alias and " " not in inner_alias)
+##
+#   Convert the path cost information text file to an Excel file.
+##
+def convert_pathcost_file_to_excel(input_file, output_excel):
+    write_path_cost_excel(parse_pathcost_txt(input_file), output_excel)
 
-            # No matter if it's a join or not, reset the state for the next RELOPTINFO ()
-            current_list_type = None
-            last_path = None
-            continue
+PATH_SECTIONS = [("path_list", "Path List:"),
+                 ("partial_path_list", "Partial Path List:"),
+                 ("parameterized_path_list", "Parameterized Path List:")]
+EXCEL_COLUMN_WIDTHS = [12, 40, 10, 15, 15, 25]
 
-        if path_list_pattern.match(line):
-            if not inside_base_relopt:  # If not inside base reloptinfo, skip this line
-                continue
-            current_list_type = "path_list"
-            last_path = None
-            continue
+##
+#   Rows of the sheet of a table: the path lists one after the other, with
+#   blank lines between the partitions. Only the parameterized paths have
+#   a "Required Outer" column.
+##
+def iter_sheet_rows(alias, lists):
+    yield [f"Table: {alias}"]
+    for key, heading in PATH_SECTIONS:
+        columns = list(PATH_KEY_COLUMNS)
+        if key == "parameterized_path_list":
+            columns.append("Required Outer")
+        if lists[key]:
+            yield [heading]
+            yield columns
+            for p in iter_blank_between_partitions(lists[key]):
+                yield [p.get(c) for c in columns]
+        if key != "parameterized_path_list":
+            yield []
 
-        if partial_path_list_pattern.match(line):
-            if not inside_base_relopt:
-                continue
-            current_list_type = "partial_path_list"
-            last_path = None
-            continue
-        
-        # If we encounter a line that indicates the cheapest path, we stop collecting paths
-        if cheapest_path_heading.match(line):
-            current_list_type = None
-            last_path = None
-            continue
+##
+#   Write the path lists (table → path lists) to an Excel file,
+#   one sheet per table. The rows are streamed to a write-only workbook.
+##
+def write_path_cost_excel(data, output_excel):
+    wb = Workbook(write_only=True)
+    for alias, lists in data.items():
+        ws = wb.create_sheet(title=alias)
+        for i, width in enumerate(EXCEL_COLUMN_WIDTHS, start=1):
+            ws.column_dimensions[get_column_letter(i)].width = width
+        for row in iter_sheet_rows(alias, lists):
+            ws.append(row)
+    wb.save(output_excel)
+
+# columns of the path records shown for the join relations
+JOIN_COLUMNS = ["Required Outer", "Scan Type", "Outer Path", "Outer Relation",
+                "Inner Path", "Inner Relation", "Rows", "Startup Cost", "Total Cost"]
+JOIN_HEADER = (["Join Relation", "List"] + ["Path Type" if c == "Scan Type" else c for c in JOIN_COLUMNS]
+               + ["Extra Cost", "Extra %"])
+JOIN_COLUMN_WIDTHS = [40, 22, 25, 14, 14, 40, 14, 40, 10, 15, 15, 15, 12]
 
-        path_match = path_pattern.match(line)
-        if path_match and current_alias and inside_base_relopt:
-            scan_type, table, rows, startup_cost, total_cost = path_match.groups()
-            ro_match = required_outer_pattern.search(line)
-            required_outer = ro_match.group(1) if ro_match else None
-            try:
-                rows = int(rows)
-                startup_cost = float(startup_cost)
-                total_cost = float(total_cost)
-            except ValueError:
-                print(f"[ERROR] Skipping invalid cost values: {startup_cost}..{total_cost}")
-                continue
+##
+#   Rows of the join paths: per join relation (the smaller ones first), list
+#   and required_outer, the unique paths from the cheapest one, each with its
+#   extra cost over the cheapest (absolute and relative).
+##
+def iter_join_rows(join_data):
+    yield JOIN_HEADER
+    for rel in sorted(join_data, key=lambda r: (len(r.split()), r)):
+        for key, heading in PATH_SECTIONS:
+            table = PathTable(join_data[rel][key])
+            positions = table.unique_positions()
+            outers = table.array["required_outer"][positions]
+            for outer in np.unique(outers).tolist():
+                ordered = table.cost_order(positions[outers == outer]).tolist()
+                cheapest = table.paths[ordered[0]].total_cost
+                for position in ordered:
+                    p = table.paths[position]
+                    extra = p.total_cost - cheapest
+                    yield ([rel, heading.rstrip(":")] + [p.get(c) for c in JOIN_COLUMNS]
+                           + [extra, extra / cheapest * 100 if cheapest > 0 else None])
+            if len(positions):
+                yield []
 
-            if current_alias == "TABLE_ITEMS" and table != "TABLE_ITEMS":
-                continue
+##
+#   Write the join paths (join relation → path lists) to an Excel file, a
+#   single sheet: a 20-way join has thousands of join relations.
+##
+def write_join_path_excel(join_data, output_excel):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title="Join Paths")
+    for i, width in enumerate(JOIN_COLUMN_WIDTHS, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+    ws.freeze_panes = "A2"
+    for row in iter_join_rows(join_data):
+        ws.append(row)
+    wb.save(output_excel)
+
+PATH_TABLE_SCHEMA = pa.schema([
+    ("table", pa.string()),
+    ("list", pa.string()),
+    ("scan_type", pa.string()),
+    ("index_name", pa.string()),
+    ("rows", pa.int64()),
+    ("startup_cost", pa.float64()),
+    ("total_cost", pa.float64()),
+    ("required_outer", pa.string()),
+    ("partition", pa.string()),
+])
+PATH_TABLE_FORMATS = ("csv", "parquet")
+
+def _iter_table_rows(data, key):
+    for alias, lists in data.items():
+        table = PathTable(lists[key])
+        positions = table.unique_positions()
+        parts = table.partition_codes(positions)
+        for position, part in zip(positions.tolist(), parts.tolist()):
+            p = table.paths[position]
+            yield (alias, key, p.scan_type, p.index_name, p.rows, p.startup_cost,
+                   p.total_cost, p.required_outer, table.name(part))
 
-            path = {
-                "Scan Type": scan_type,
-                "Index Name": None,
-                "Rows": rows,
-                "Startup Cost": startup_cost,
-                "Total Cost": total_cost,
-                "Required Outer": required_outer,
-            }
-            
-            if required_outer:
-                list_key = "parameterized_path_list"
-            else:
-                list_key = current_list_type
-            
-            if list_key is None:
-                continue            # No path list type found, skip this line
-
-            data[current_alias][list_key].append(path)
-            last_path = path
-            continue
-
-        index_name_match = index_name_pattern.match(line)
-        if index_name_match and last_path:
-            index_name = index_name_match.group(1)
-            last_path["Index Name"] = index_name
-            continue
-
-    with pd.ExcelWriter(output_excel) as writer:
-        for alias, lists in data.items():
-            sheet_data = [[f"Table: {alias}"]]
-
-            df_path_list = pd.DataFrame(insert_blank_between_partitions(lists["path_list"]))
-            df_partial_path_list = pd.DataFrame(insert_blank_between_partitions(lists["partial_path_list"]))
-            df_parameterized_path_list = pd.DataFrame(insert_blank_between_partitions(lists["parameterized_path_list"]))
-
-            if not df_path_list.empty:
-                sheet_data.append(["Path List:"])
-                sheet_data.append(["Scan Type", "Index Name", "Rows", "Startup Cost", "Total Cost"])
-                sheet_data.extend(df_path_list.drop(columns=["Required Outer"]).values.tolist())
-
-            sheet_data.append([])
-
-            if not df_partial_path_list.empty:
-                sheet_data.append(["Partial Path List:"])
-                sheet_data.append(["Scan Type", "Index Name", "Rows", "Startup Cost", "Total Cost"])
-                sheet_data.extend(df_partial_path_list.drop(columns=["Required Outer"]).values.tolist())
-                
-            sheet_data.append([])
-                
-            if not df_parameterized_path_list.empty:
-                sheet_data.append(["Parameterized Path List:"])
-                sheet_data.append(["Scan Type", "Index Name", "Rows", "Startup Cost", "Total Cost", "Required Outer"])
-                sheet_data.extend(df_parameterized_path_list.values.tolist())
-
-            pd.DataFrame(sheet_data).to_excel(writer, index=False, header=False, sheet_name=alias)
-
-    wb = load_workbook(output_excel)
-    for sheet_name in wb.sheetnames:
-        ws = wb[sheet_name]
-        column_widths = [12, 40, 10, 15, 15, 25]
-
-        for i, width in enumerate(column_widths, start=1):
-            col_letter = ws.cell(row=1, column=i).column_letter
-            ws.column_dimensions[col_letter].width = width
-
-    wb.save(output_excel)
\ No newline at end of file
+##
+#   Write the path lists (table → path lists) as one table, one row per
+#   unique path (no blank lines, partition in its own column), for the
+#   analyses: csv or parquet, written list by list.
+##
+def write_path_cost_table(data, output_path, table_format="parquet"):
+    if table_format == "csv":
+        with open(output_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(PATH_TABLE_SCHEMA.names)
+            for key, heading in PATH_SECTIONS:
+                writer.writerows(_iter_table_rows(data, key))
+    elif table_format == "parquet":
+        with pq.ParquetWriter(output_path, PATH_TABLE_SCHEMA) as writer:
+            for key, heading in PATH_SECTIONS:
+                columns = list(zip(*_iter_table_rows(data, key)))
+                if columns:
+                    writer.write_table(pa.table(
+                        [pa.array(c, type=field.type) for c, field in zip(columns, PATH_TABLE_SCHEMA)],
+                        schema=PATH_TABLE_SCHEMA))
+    else:
+        raise ValueError(f"Unknown path cost table format: {table_format}")
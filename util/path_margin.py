@@ -0,0 +1,216 @@
+import os
+import re
+import sys
+import itertools
+import numpy as np
+import pandas as pd
+from util.path_cost import PathCostLog, PathTable, parse_explain_json, get_log_search_alias, read_marker
+from util.path_cost import read_log_name
+
+##
+#   Margin of the winning path of every base relation, and how it moves
+#   across configurations.
+#   For each relation (and each required_outer of its parameterized paths)
+#   the margin is the cost gap between the cheapest path and the cheapest
+#   other access path (runner-up). A relation whose winner changes between
+#   configurations while its margin is small is a plan-instability risk: a
+#   small change of the costs or the statistics flips its plan.
+##
+MARGIN_PARAMS = ["random_page_cost", "cpu_index_tuple_cost", "effective_cache_size"]
+MARGIN_LISTS = ("path_list", "parameterized_path_list")
+# relative gap under which a margin is narrow
+NARROW_MARGIN = 0.05
+
+MEMORY_UNITS = {"B": 1 / 1024, "kB": 1, "MB": 1024, "GB": 1024 ** 2, "TB": 1024 ** 3}
+
+##
+#   conf.conf of a report folder (name='value' lines) → dict
+##
+def read_conf_file(path):
+    conf = {}
+    with open(path, "r") as f:
+        for line in f:
+            m = re.match(r"^\s*([\w.]+)\s*=\s*'?(.*?)'?\s*$", line)
+            if m:
+                conf[m.group(1)] = m.group(2)
+    return conf
+
+##
+#   Numeric value of a setting, memory sizes in kB ("4GB" → 4194304),
+#   None when it is not a number.
+##
+def setting_value(value):
+    m = re.match(r"^\s*(-?[\d.]+)\s*([A-Za-z]*)\s*$", str(value))
+    if not m:
+        return None
+    number, unit = m.groups()
+    if unit and unit not in MEMORY_UNITS:
+        return None
+    try:
+        return float(number) * MEMORY_UNITS.get(unit, 1)
+    except ValueError:
+        return None
+
+def path_label(path):
+    return path.scan_type + (" " + path.index_name if path.index_name else "")
+
+##
+#   Cheapest path and runner-up (the cheapest path of another access path)
+#   of every relation of the path data (table → path lists, see
+#   PathCostLog.path_data), per required_outer.
+##
+def path_margins(data):
+    rows = []
+    for table_name, lists in data.items():
+        for key in MARGIN_LISTS:
+            table = PathTable(lists[key])
+            positions = table.unique_positions()
+            outers = table.array["required_outer"][positions]
+            for outer in np.unique(outers).tolist():
+                ordered = table.cost_order(positions[outers == outer])
+                paths = [table.paths[p] for p in ordered.tolist()]
+                winner = paths[0]
+                runner_up = next((p for p in paths[1:] if path_label(p) != path_label(winner)), None)
+                row = {
+                    "table": table_name,
+                    "required_outer": table.name(outer),
+                    "n_paths": len(paths),
+                    "winner": path_label(winner),
+                    "winner_cost": winner.total_cost,
+                    "runner_up": path_label(runner_up) if runner_up else None,
+                    "runner_up_cost": runner_up.total_cost if runner_up else np.nan,
+                }
+                row["gap"] = row["runner_up_cost"] - row["winner_cost"]
+                row["rel_gap"] = row["gap"] / row["winner_cost"] if row["winner_cost"] > 0 else np.nan
+                rows.append(row)
+    return rows
+
+##
+#   Margins of every marked execution of a report directory
+#   (<folder>/conf.conf, <folder>/plan/<sql>_<i>.json and .marker), read
+#   from the log of the run. One row per execution, relation and
+#   required_outer, with the settings of the configuration as columns.
+#   log_path : the log file, or the directory of the shipped logs, the log
+#   of every execution is then the one of its configuration (.logname).
+##
+def load_report_margins(report_path, log_path):
+    path_logs = {}
+    def log_of(json_path):
+        path = log_path
+        if os.path.isdir(log_path):
+            log_name = read_log_name(json_path)
+            if log_name is None or not os.path.exists(os.path.join(log_path, log_name)):
+                return None
+            path = os.path.join(log_path, log_name)
+        if path not in path_logs:
+            path_logs[path] = PathCostLog(path, use_index=True)
+        return path_logs[path]
+    rows = []
+    for folder in sorted(os.listdir(report_path)):
+        plan_dir = os.path.join(report_path, folder, "plan")
+        conf_path = os.path.join(report_path, folder, "conf.conf")
+        if not os.path.isdir(plan_dir) or not os.path.exists(conf_path):
+            continue
+        conf = read_conf_file(conf_path)
+        for plan_file in sorted(os.listdir(plan_dir)):
+            if not plan_file.endswith(".json"):
+                continue
+            json_path = os.path.join(plan_dir, plan_file)
+            marker = read_marker(json_path)
+            path_log = log_of(json_path) if marker is not None else None
+            # without its markers, the blocks of the execution cannot be told apart
+            if path_log is None or not path_log.has_marker(marker):
+                continue
+            sql = os.path.splitext(plan_file)[0]
+            needed = {get_log_search_alias(a) for a in parse_explain_json(json_path)}
+            for row in path_margins(path_log.path_data(needed, marker)):
+                row.update({"folder": folder, "query": sql.rsplit("_", 1)[0],
+                            "iteration": int(sql.rsplit("_", 1)[1])})
+                row.update(conf)
+                rows.append(row)
+    for path_log in path_logs.values():
+        path_log.close()
+    return pd.DataFrame(rows)
+
+##
+#   Stability of the winner of every relation across the configurations:
+#     • n_winners, winners → the distinct winning paths
+#     • min_rel_gap, median_rel_gap → how close the runner-up gets
+#     • flips, flip_params → pairs of configurations that differ by a single
+#       setting and have different winners, and these settings
+#     • gap_corr_<param> → rank correlation of the margin with the setting
+#     • unstable → the winner changes and the margin gets narrower than threshold
+##
+def margin_stability(margins: pd.DataFrame, params=MARGIN_PARAMS, threshold=NARROW_MARGIN):
+    if margins.empty:
+        return pd.DataFrame()
+    keys = ["query", "table", "required_outer"]
+    conf_columns = [c for c in margins.columns if c not in {
+        "table", "required_outer", "n_paths", "winner", "winner_cost", "runner_up", "runner_up_cost",
+        "gap", "rel_gap", "folder", "query", "iteration"}]
+    # the iterations of a configuration plan the same, keep the first one
+    per_conf = (margins.sort_values("iteration")
+                .drop_duplicates(subset=keys + ["folder"], keep="first")
+                .fillna({"required_outer": ""}))
+    rows = []
+    for key, group in per_conf.groupby(keys, sort=True):
+        row = dict(zip(keys, key))
+        winners = sorted(group["winner"].unique())
+        row.update({
+            "n_configs": len(group),
+            "n_winners": len(winners),
+            "winners": " | ".join(winners),
+            "min_rel_gap": group["rel_gap"].min(),
+            "median_rel_gap": group["rel_gap"].median(),
+        })
+        flips = 0
+        flip_params = set()
+        records = group[conf_columns + ["winner"]].to_dict("records")
+        for a, b in itertools.combinations(records, 2):
+            changed = [c for c in conf_columns if str(a[c]) != str(b[c])]
+            if len(changed) == 1 and a["winner"] != b["winner"]:
+                flips += 1
+                flip_params.add(changed[0])
+        row["flips"] = flips
+        row["flip_params"] = ",".join(sorted(flip_params))
+        for param in params:
+            if param not in group.columns:
+                continue
+            values = group[param].map(setting_value)
+            if values.nunique() > 1:
+                # Spearman: Pearson correlation of the ranks
+                row["gap_corr_" + param] = values.rank().corr(group["rel_gap"].rank())
+        row["unstable"] = bool(len(winners) > 1 and row["min_rel_gap"] < threshold)
+        rows.append(row)
+    df = pd.DataFrame(rows)
+    df["required_outer"] = df["required_outer"].replace("", None)
+    return df.sort_values(["unstable", "min_rel_gap"], ascending=[False, True]).reset_index(drop=True)
+
+def print_stability(stability: pd.DataFrame, threshold=NARROW_MARGIN, top=20):
+    if stability.empty:
+        print("[WARNING] No margin to analyze")
+        return
+    unstable = stability[stability["unstable"]]
+    print("[INFO] {0} of {1} relations flip their winner on a margin under {2:.0%}".format(
+        len(unstable), len(stability), threshold))
+    columns = ["query", "table", "required_outer", "n_configs", "winners", "min_rel_gap", "flip_params"]
+    print(stability[columns].head(top).to_string(index=False))
+
+def export_margins(report_path, log_path, threshold=NARROW_MARGIN):
+    margins = load_report_margins(report_path, log_path)
+    if margins.empty:
+        print(f"[WARNING] No marked execution of {report_path} found in {log_path}")
+        return margins, pd.DataFrame()
+    stability = margin_stability(margins, threshold=threshold)
+    margins.to_csv(os.path.join(report_path, "path_margins.csv"), index=False)
+    stability.to_csv(os.path.join(report_path, "path_stability.csv"), index=False)
+    print_stability(stability, threshold)
+    return margins, stability
+
+
+if __name__ == "__main__":
+    # python -m util.path_margin ./report/report_<ts> ./path_analysis/logs [threshold]
+    if len(sys.argv) < 3:
+        print("usage: python -m util.path_margin <report dir> <log file|log dir> [threshold]")
+        sys.exit(1)
+    export_margins(sys.argv[1], sys.argv[2], float(sys.argv[3]) if len(sys.argv) > 3 else NARROW_MARGIN)
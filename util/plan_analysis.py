@@ -0,0 +1,120 @@
+import os
+import json
+import hashlib
+import pandas as pd
+
+##
+#   Fields of a plan node that describe the shape of the plan.
+#   Costs, row estimates and every "Actual ..." / buffer / timing value are
+#   left out, so two runs of the same plan get the same fingerprint.
+##
+SHAPE_KEYS = (
+    "Node Type", "Parent Relationship", "Subplan Name", "Join Type", "Strategy",
+    "Partial Mode", "Scan Direction", "Relation Name", "Schema", "Alias",
+    "Index Name", "CTE Name", "Function Name", "Parallel Aware",
+    "Workers Planned", "Single Copy", "Command",
+)
+
+##
+#   Return the root node of an EXPLAIN (FORMAT JSON) output, whether it is
+#   the whole output (a list), its first element or the root node itself.
+##
+def get_plan_root(explain):
+    if isinstance(explain, list) and len(explain) > 0:
+        explain = explain[0]
+    if isinstance(explain, dict) and "Plan" in explain:
+        return explain["Plan"]
+    if isinstance(explain, dict) and "Node Type" in explain:
+        return explain
+    return None
+
+##
+#   Pre-order traversal of the plan tree, yields (node, depth).
+##
+def iter_plan_nodes(plan_node, depth=0):
+    yield plan_node, depth
+    for sp in plan_node.get("Plans", []):
+        yield from iter_plan_nodes(sp, depth + 1)
+
+##
+#   Time spent in the node and its children over all its loops (ms).
+##
+def node_inclusive_time(plan_node):
+    return plan_node.get("Actual Total Time", 0.0) * plan_node.get("Actual Loops", 1)
+
+##
+#   Time spent in the node itself (ms): inclusive time minus the inclusive
+#   time of its children. With parallel workers the actual times are
+#   averages per process, so this is an approximation for those nodes.
+##
+def node_exclusive_time(plan_node):
+    children = sum(node_inclusive_time(sp) for sp in plan_node.get("Plans", []))
+    return max(node_inclusive_time(plan_node) - children, 0.0)
+
+def plan_shape(plan_node):
+    shape = {k: plan_node[k] for k in SHAPE_KEYS if k in plan_node}
+    subplans = plan_node.get("Plans", [])
+    if subplans:
+        shape["Plans"] = [plan_shape(sp) for sp in subplans]
+    return shape
+
+##
+#   Hash of the plan shape: node types, join order and methods, relations,
+#   index names and parallel settings.
+##
+def plan_fingerprint(explain):
+    root = get_plan_root(explain)
+    if root is None:
+        return None
+    shape = json.dumps(plan_shape(root), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(shape.encode("utf-8")).hexdigest()[:16]
+
+##
+#   Read every report.csv of a report folder into one DataFrame,
+#   with the query name and the folder (configuration) of every row.
+##
+def load_report_dir(report_path):
+    frames = []
+    for folder in sorted(os.listdir(report_path)):
+        csv_path = os.path.join(report_path, folder, "report.csv")
+        if not os.path.exists(csv_path):
+            continue
+        df = pd.read_csv(csv_path, index_col=0)
+        df["query"] = df["sql"].str.rsplit("_", n=1).str[0]
+        df["folder"] = folder
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+##
+#   Group the latency of each query by plan fingerprint. One row per
+#   (query, fingerprint) with the configurations in which this plan was seen
+#   (config_column is "folder" for report folders, "conf_id" for the store).
+#   The runs cancelled by their budget have no plan and only their budget as
+#   time, they are left out of the statistics and counted in the censored
+#   column of the query (see util.stats for their statistics).
+##
+def group_by_fingerprint(df, config_column="folder"):
+    if df.empty or "fingerprint" not in df.columns:
+        return pd.DataFrame()
+    df = df.copy()
+    censored = df["censored"].fillna(False).astype(bool) if "censored" in df.columns else pd.Series(False, index=df.index)
+    censored_per_query = censored.groupby(df["query"]).sum()
+    df = df[~censored]
+    if df.empty:
+        return pd.DataFrame()
+    df["fingerprint"] = df["fingerprint"].fillna("unknown")
+    summary = df.groupby(["query", "fingerprint"]).agg(
+        runs=("total_time", "size"),
+        mean_total_time=("total_time", "mean"),
+        median_total_time=("total_time", "median"),
+        min_total_time=("total_time", "min"),
+        configs=(config_column, lambda x: ";".join(sorted(x.astype(str).unique()))),
+    ).reset_index()
+    summary["plans_for_query"] = summary.groupby("query")["fingerprint"].transform("size")
+    summary["censored"] = summary["query"].map(censored_per_query).fillna(0).astype(int)
+    return summary.sort_values(["query", "median_total_time"])
+
+def summarize_by_fingerprint(report_path):
+    return group_by_fingerprint(load_report_dir(report_path), "folder")
@@ -0,0 +1,156 @@
+import sys
+import json
+import pandas as pd
+from util.plan_analysis import get_plan_root, node_exclusive_time
+
+##
+#   Node-level diff of two plans captured by Connection.get_explain_of_query
+#   (for example the same query under two configurations).
+#   The nodes are aligned recursively: children covering the same set of
+#   relations are matched first, the rest by position. A node without
+#   counterpart is reported as only in A or only in B.
+##
+DIFF_FIELDS = (
+    ("node_type", "Node Type"),
+    ("join_type", "Join Type"),
+    ("relation", "Relation Name"),
+    ("alias", "Alias"),
+    ("index_name", "Index Name"),
+    ("plan_rows", "Plan Rows"),
+    ("actual_rows", "Actual Rows"),
+    ("loops", "Actual Loops"),
+    ("shared_hit", "Shared Hit Blocks"),
+    ("shared_read", "Shared Read Blocks"),
+    ("temp_read", "Temp Read Blocks"),
+    ("temp_written", "Temp Written Blocks"),
+)
+
+def load_plan_file(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+##
+#   Aliases of the relations scanned under the node, used to recognize the
+#   same sub-tree in both plans even when the join order changed.
+##
+def subtree_relations(plan_node):
+    rels = set()
+    if "Alias" in plan_node:
+        rels.add(plan_node["Alias"])
+    elif "Relation Name" in plan_node:
+        rels.add(plan_node["Relation Name"])
+    for sp in plan_node.get("Plans", []):
+        rels |= subtree_relations(sp)
+    return frozenset(rels)
+
+def node_label(plan_node):
+    if plan_node is None:
+        return ""
+    label = plan_node.get("Node Type", "")
+    if "Join Type" in plan_node and plan_node.get("Node Type", "").endswith(("Join", "Loop")):
+        label = "{0} {1}".format(plan_node["Join Type"], label)
+    target = plan_node.get("Alias") or plan_node.get("Relation Name")
+    if target:
+        label += " on " + target
+    if "Index Name" in plan_node:
+        label += " using " + plan_node["Index Name"]
+    return label
+
+def match_children(children_a, children_b):
+    pairs = []
+    left_b = list(range(len(children_b)))
+    unmatched_a = []
+    rels_b = [subtree_relations(c) for c in children_b]
+    for ia, ca in enumerate(children_a):
+        rels_a = subtree_relations(ca)
+        hit = next((ib for ib in left_b if rels_b[ib] == rels_a), None)
+        if hit is None:
+            unmatched_a.append(ia)
+        else:
+            left_b.remove(hit)
+            pairs.append((ia, hit))
+    # the remaining children are matched by position
+    for ia, ib in zip(unmatched_a, list(left_b)):
+        left_b.remove(ib)
+        pairs.append((ia, ib))
+    matched_a = {ia for ia, _ in pairs}
+    pairs += [(ia, None) for ia in range(len(children_a)) if ia not in matched_a]
+    pairs += [(None, ib) for ib in left_b]
+    return pairs
+
+def align_plans(node_a, node_b, path="0", depth=0):
+    rows = [(path, depth, node_a, node_b)]
+    children_a = node_a.get("Plans", []) if node_a is not None else []
+    children_b = node_b.get("Plans", []) if node_b is not None else []
+    for n, (ia, ib) in enumerate(match_children(children_a, children_b)):
+        ca = children_a[ia] if ia is not None else None
+        cb = children_b[ib] if ib is not None else None
+        rows += align_plans(ca, cb, "{0}.{1}".format(path, n), depth + 1)
+    return rows
+
+def node_values(plan_node):
+    if plan_node is None:
+        return {name: None for name, _ in DIFF_FIELDS + (("exclusive_ms", None),)}
+    values = {name: plan_node.get(key) for name, key in DIFF_FIELDS}
+    values["exclusive_ms"] = node_exclusive_time(plan_node)
+    return values
+
+##
+#   Diff two EXPLAIN outputs. One row per aligned node, with the values of
+#   both plans, the list of changed fields, and the exclusive time delta.
+#   The rows are ranked by how much of the latency delta they explain.
+##
+def diff_plans(explain_a, explain_b):
+    rows = []
+    for path, depth, node_a, node_b in align_plans(get_plan_root(explain_a), get_plan_root(explain_b)):
+        va = node_values(node_a)
+        vb = node_values(node_b)
+        if node_a is None:
+            status = "only in B"
+        elif node_b is None:
+            status = "only in A"
+        else:
+            status = "matched"
+        changed = [name for name, _ in DIFF_FIELDS if va[name] != vb[name]]
+        row = {"path": path, "depth": depth, "status": status,
+               "node_a": node_label(node_a), "node_b": node_label(node_b),
+               "changed": ",".join(changed)}
+        for name in va:
+            row[name + "_a"] = va[name]
+            row[name + "_b"] = vb[name]
+        row["delta_exclusive_ms"] = (vb["exclusive_ms"] or 0.0) - (va["exclusive_ms"] or 0.0)
+        rows.append(row)
+    df = pd.DataFrame(rows)
+    total_delta = df["delta_exclusive_ms"].sum()
+    df["share_of_delta"] = df["delta_exclusive_ms"] / total_delta if total_delta else 0.0
+    df["rank"] = df["delta_exclusive_ms"].abs().rank(ascending=False, method="first").astype(int)
+    return df.sort_values("rank")
+
+def print_plan_diff(df, explain_a, explain_b, top=10):
+    if isinstance(explain_a, list):
+        explain_a = explain_a[0]
+    if isinstance(explain_b, list):
+        explain_b = explain_b[0]
+    for name in ("Planning Time", "Execution Time"):
+        a = explain_a.get(name)
+        b = explain_b.get(name)
+        print("{0:15s} A: {1} ms   B: {2} ms".format(name, a, b))
+    print("Nodes explaining most of the latency delta:")
+    for _, row in df.head(top).iterrows():
+        print("  #{0:<3d} {1:12s} {2:+10.2f} ms  A: {3}  B: {4}  changed: {5}".format(
+            row["rank"], row["path"], row["delta_exclusive_ms"],
+            row["node_a"] or "-", row["node_b"] or "-", row["changed"] or "-"))
+
+
+if __name__ == "__main__":
+    # python -m util.plan_diff plan_a.json plan_b.json [diff.csv]
+    if len(sys.argv) < 3:
+        print("usage: python -m util.plan_diff <plan_a.json> <plan_b.json> [output.csv]")
+        sys.exit(1)
+    plan_a = load_plan_file(sys.argv[1])
+    plan_b = load_plan_file(sys.argv[2])
+    diff = diff_plans(plan_a, plan_b)
+    print_plan_diff(diff, plan_a, plan_b)
+    if len(sys.argv) > 3:
+        diff.to_csv(sys.argv[3], index=False)
+        print("[INFO] The diff has been saved to:", sys.argv[3])
@@ -0,0 +1,236 @@
+import os
+import sys
+import json
+import pandas as pd
+from util.plan_analysis import get_plan_root, node_inclusive_time
+
+##
+#   Columns extracted from every plan node: (column name, EXPLAIN field).
+#   The buffer, temp and I/O timing counters of EXPLAIN are cumulative:
+#   a node includes the counters of its children.
+##
+NODE_FIELDS = (
+    ("node_type", "Node Type"),
+    ("relation", "Relation Name"),
+    ("alias", "Alias"),
+    ("index_name", "Index Name"),
+    ("startup_cost", "Startup Cost"),
+    ("total_cost", "Total Cost"),
+    ("plan_rows", "Plan Rows"),
+    ("actual_rows", "Actual Rows"),
+    ("loops", "Actual Loops"),
+    ("rows_removed", "Rows Removed by Filter"),
+    ("workers_planned", "Workers Planned"),
+    ("workers_launched", "Workers Launched"),
+)
+COUNTER_FIELDS = (
+    ("shared_hit", "Shared Hit Blocks"),
+    ("shared_read", "Shared Read Blocks"),
+    ("shared_dirtied", "Shared Dirtied Blocks"),
+    ("shared_written", "Shared Written Blocks"),
+    ("local_hit", "Local Hit Blocks"),
+    ("local_read", "Local Read Blocks"),
+    ("temp_read", "Temp Read Blocks"),
+    ("temp_written", "Temp Written Blocks"),
+    ("io_read_time", "I/O Read Time"),
+    ("io_write_time", "I/O Write Time"),
+    # time spent reading / writing the temp files (PG 15+), the cost of a work_mem spill
+    ("temp_io_read_time", "Temp I/O Read Time"),
+    ("temp_io_write_time", "Temp I/O Write Time"),
+)
+# conditions of a node, the first one found is kept as its predicate
+PREDICATE_KEYS = ("Index Cond", "Recheck Cond", "Filter", "Hash Cond", "Merge Cond", "Join Filter")
+# JIT section of the output (PG 11+), present when the plan was compiled:
+# number of functions and time (ms) of every compilation step
+JIT_FIELDS = (
+    ("jit_functions", "Functions"),
+    ("jit_generation_ms", "Generation"),
+    ("jit_inlining_ms", "Inlining"),
+    ("jit_optimization_ms", "Optimization"),
+    ("jit_emission_ms", "Emission"),
+    ("jit_total_ms", "Total"),
+)
+COUNTER_COLUMNS = [name for name, _ in COUNTER_FIELDS]
+JIT_COLUMNS = [name for name, _ in JIT_FIELDS]
+PLAN_TOTAL_COLUMNS = COUNTER_COLUMNS + ["workers_launched"] + JIT_COLUMNS
+
+##
+#   Number of base relations scanned under the node (its join level).
+##
+def count_relations(plan_node):
+    n = 1 if "Relation Name" in plan_node else 0
+    for sp in plan_node.get("Plans", []):
+        n += count_relations(sp)
+    return n
+
+##
+#   Append the nodes of one plan to a dict of columns (one list per column).
+#   meta holds the columns identifying the plan (folder, sql, ...).
+##
+def flatten_plan(explain, columns: dict, meta: dict):
+    root = get_plan_root(explain)
+    if root is None:
+        return 0
+    stack = [(root, -1, 0)]
+    node_id = 0
+    while stack:
+        node, parent_id, depth = stack.pop()
+        for k, v in meta.items():
+            columns.setdefault(k, []).append(v)
+        columns.setdefault("node_id", []).append(node_id)
+        columns.setdefault("parent_id", []).append(parent_id)
+        columns.setdefault("depth", []).append(depth)
+        for name, key in NODE_FIELDS + COUNTER_FIELDS:
+            columns.setdefault(name, []).append(node.get(key))
+        columns.setdefault("inclusive_ms", []).append(node_inclusive_time(node))
+        columns.setdefault("predicate", []).append(
+            next((node[k] for k in PREDICATE_KEYS if k in node), None))
+        columns.setdefault("relations_under", []).append(count_relations(node))
+        # reversed so that the children are numbered in plan order
+        for sp in reversed(node.get("Plans", [])):
+            stack.append((sp, node_id, depth + 1))
+        node_id += 1
+    return node_id
+
+##
+#   Compute the per-node (exclusive) counters and time from the cumulative
+#   ones, for all the nodes of all the plans at once.
+##
+def add_exclusive_columns(nodes: pd.DataFrame, plan_keys):
+    cumulative = ["inclusive_ms"] + COUNTER_COLUMNS
+    nodes[cumulative] = nodes[cumulative].apply(pd.to_numeric, errors="coerce").fillna(0.0)
+    children = nodes.groupby(plan_keys + ["parent_id"])[cumulative].sum()
+    children.index = children.index.set_names(plan_keys + ["node_id"])
+    children = children.reindex(pd.MultiIndex.from_frame(nodes[plan_keys + ["node_id"]])).fillna(0.0)
+    for col in cumulative:
+        exclusive = "exclusive_ms" if col == "inclusive_ms" else col + "_excl"
+        nodes[exclusive] = (nodes[col].to_numpy() - children[col].to_numpy()).clip(min=0.0)
+    return nodes
+
+##
+#   Flatten every plan/<sql>_<i>.json of a report folder
+#   (report/report_<ts>/<query folder>/plan/) into one table of nodes.
+##
+def extract_report_dir(report_path):
+    columns = {}
+    for folder in sorted(os.listdir(report_path)):
+        plan_dir = os.path.join(report_path, folder, "plan")
+        if not os.path.isdir(plan_dir):
+            continue
+        for plan_file in sorted(os.listdir(plan_dir)):
+            if not plan_file.endswith(".json"):
+                continue
+            with open(os.path.join(plan_dir, plan_file), "r", encoding="utf-8") as f:
+                explain = json.load(f)
+            sql = os.path.splitext(plan_file)[0]
+            flatten_plan(explain, columns, {
+                "report": os.path.basename(os.path.normpath(report_path)),
+                "folder": folder,
+                "query": sql.rsplit("_", 1)[0],
+                "sql": sql,
+            })
+    if not columns:
+        return pd.DataFrame()
+    nodes = pd.DataFrame(columns)
+    return add_exclusive_columns(nodes, ["report", "folder", "sql"])
+
+##
+#   Same table for the plans of a util.result_store.ResultStore,
+#   measurements is a DataFrame read from the store (with plan_sha).
+#   The report column holds the run id and folder the configuration id.
+##
+def extract_store(store, measurements: pd.DataFrame):
+    columns = {}
+    rows = measurements.dropna(subset=["plan_sha"])
+    for run, conf_id, query, sql, sha, actuals, extras in zip(
+            rows["run"], rows["conf_id"], rows["query"], rows["sql"],
+            rows["plan_sha"], rows["plan_actuals"], rows["plan_extras"]):
+        flatten_plan(store.get_plan(sha, actuals, extras), columns, {
+            "report": run, "folder": conf_id, "query": query, "sql": sql,
+        })
+    if not columns:
+        return pd.DataFrame()
+    nodes = pd.DataFrame(columns)
+    return add_exclusive_columns(nodes, ["report", "folder", "sql"])
+
+##
+#   One row per plan: the counters of the root node (cumulative, so they
+#   cover the whole plan), workers launched, and the node with the most
+#   temp blocks written (work_mem spills).
+##
+def plan_rollup(nodes: pd.DataFrame):
+    keys = ["report", "folder", "query", "sql"]
+    roots = nodes[nodes["depth"] == 0].set_index(keys)[COUNTER_COLUMNS + ["inclusive_ms"]]
+    per_plan = nodes.groupby(keys).agg(
+        nodes=("node_id", "size"),
+        workers_planned=("workers_planned", "sum"),
+        workers_launched=("workers_launched", "sum"),
+    )
+    rollup = roots.join(per_plan)
+    rollup["hit_ratio"] = rollup["shared_hit"] / (rollup["shared_hit"] + rollup["shared_read"]).where(
+        lambda x: x > 0)
+    rollup["spilled"] = rollup["temp_written"] > 0
+    spills = nodes[nodes["temp_written_excl"] > 0]
+    if not spills.empty:
+        worst = spills.sort_values("temp_written_excl").groupby(keys).tail(1).set_index(keys)
+        rollup["spill_node"] = worst["node_type"]
+    else:
+        rollup["spill_node"] = None
+    return rollup.reset_index()
+
+##
+#   JIT timing of one plan, 0 when the plan was not compiled.
+#   Newer versions detail some steps ({"Deform": .., "Total": ..}), their total is kept.
+##
+def jit_totals(explain):
+    if isinstance(explain, list) and len(explain) > 0:
+        explain = explain[0]
+    jit = explain.get("JIT", {}) if isinstance(explain, dict) else {}
+    timing = jit.get("Timing", {})
+    totals = {}
+    for name, key in JIT_FIELDS:
+        value = jit.get(key, 0) if key == "Functions" else timing.get(key, 0)
+        if isinstance(value, dict):
+            value = value.get("Total", 0)
+        totals[name] = value
+    return totals
+
+##
+#   Totals of one plan, used by run_test to add the counters to report.csv.
+##
+def plan_totals(explain):
+    root = get_plan_root(explain)
+    totals = {name: (root or {}).get(key, 0) for name, key in COUNTER_FIELDS}
+    launched = 0
+    if root is not None:
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            launched += node.get("Workers Launched", 0)
+            stack.extend(node.get("Plans", []))
+    totals["workers_launched"] = launched
+    totals.update(jit_totals(explain))
+    return totals
+
+##
+#   Extract the node table and the per-plan rollup of a report folder
+#   (or use the given node table), and save them as plan_nodes.csv and
+#   plan_rollup.csv in the folder.
+##
+def export_plan_metrics(report_path, nodes=None):
+    if nodes is None:
+        nodes = extract_report_dir(report_path)
+    if nodes.empty:
+        print(f"[WARNING] No plan found in {report_path}")
+        return nodes, pd.DataFrame()
+    rollup = plan_rollup(nodes)
+    nodes.to_csv(os.path.join(report_path, "plan_nodes.csv"), index=False)
+    rollup.to_csv(os.path.join(report_path, "plan_rollup.csv"), index=False)
+    print(f"[INFO] {len(nodes)} plan nodes of {len(rollup)} plans extracted from {report_path}")
+    return nodes, rollup
+
+
+if __name__ == "__main__":
+    # python -m util.plan_metrics ./report/report_<ts> [./report/report_<ts> ...]
+    for path in sys.argv[1:]:
+        export_plan_metrics(path)
@@ -0,0 +1,105 @@
+import random
+import psycopg2
+import pandas as pd
+from util.connection import Connection
+from util.plan_analysis import plan_fingerprint
+
+##
+#   Plan-only pre-pass of a configuration sweep.
+#
+#   Most combinations of a JSON grid give exactly the same plan for every
+#   query. The planner only reads the settings below, and they can all be
+#   changed with SET in a session, so the plans of every combination are
+#   obtained with EXPLAIN (no ANALYZE, no restart) on the running server.
+#   The server must run the base configuration of the measured runs
+#   (default.conf, see main.run_test): the settings out of the grid are then
+#   the same for the pre-pass and the measurements.
+#   Two combinations are equivalent when their other settings are equal and
+#   every query gets the same plan fingerprint: only the first combination
+#   of each class needs the measured sweep.
+#   Settings also read by the executor (memory for sorts and hashes, leader
+#   participation) are set for the planner but kept apart in the classes:
+#   the same plan runs differently under them. jit is left out, it does not
+#   change the plan shape but does change the execution.
+##
+PLANNER_SETTINGS = frozenset((
+    "seq_page_cost", "random_page_cost", "cpu_tuple_cost", "cpu_index_tuple_cost",
+    "cpu_operator_cost", "parallel_setup_cost", "parallel_tuple_cost",
+    "min_parallel_table_scan_size", "min_parallel_index_scan_size",
+    "effective_cache_size", "work_mem", "hash_mem_multiplier",
+    "max_parallel_workers_per_gather", "parallel_leader_participation",
+    "join_collapse_limit", "from_collapse_limit",
+    "geqo", "geqo_threshold", "geqo_effort", "geqo_pool_size", "geqo_generations",
+    "geqo_selection_bias", "geqo_seed",
+    "constraint_exclusion", "cursor_tuple_fraction", "plan_cache_mode",
+))
+EXECUTOR_SETTINGS = frozenset(("work_mem", "hash_mem_multiplier", "parallel_leader_participation"))
+
+def is_planner_setting(name:str):
+    return name.startswith("enable_") or name in PLANNER_SETTINGS
+
+def split_settings(combination:dict):
+    planner = {k: v for k, v in combination.items() if is_planner_setting(k)}
+    others = {k: v for k, v in combination.items() if not is_planner_setting(k)}
+    return planner, others
+
+##
+#   Fingerprint of the plan of every query under the planner settings.
+#   connections : query name → Connection, kept open over all the settings.
+#   A query the planner fails on gets "error".
+##
+def fingerprint_queries(connections:dict, settings:dict):
+    fingerprints = {}
+    for name, conn in connections.items():
+        try:
+            fingerprints[name] = plan_fingerprint(conn.get_plan_of_query(settings))
+        except psycopg2.Error as e:
+            print("[WARNING] EXPLAIN of", name, "failed :", str(e).strip())
+            fingerprints[name] = "error"
+    return fingerprints
+
+##
+#   Run the pre-pass over the combinations (dicts parameter → value, as given
+#   by generate_all_possible_config). Queries with placeholders are rendered
+#   once with a fixed seed, so every combination plans the same query.
+#   Returns (representatives, classes): the combinations to measure and one
+#   row per combination with its class, its representative and the
+#   fingerprint of every query.
+##
+def presweep(combinations, query_dict:dict, params:dict, templates=None, seed=0):
+    combinations = list(combinations)
+    templates = templates or {}
+    rng = random.Random(seed)
+    connections = {}
+    for k, v in query_dict.items():
+        query = templates[k].render(rng)[0] if k in templates else v
+        connections[k.split('.')[0]] = Connection(params=params, query=query)
+    plans_of = {}
+    rows = []
+    class_of = {}
+    representatives = []
+    try:
+        for n, combination in enumerate(combinations):
+            planner, others = split_settings(combination)
+            planner_key = tuple(sorted((k, str(v)) for k, v in planner.items()))
+            # combinations differing only in other settings share the planner pass
+            if planner_key not in plans_of:
+                plans_of[planner_key] = fingerprint_queries(connections, planner)
+            fingerprints = plans_of[planner_key]
+            others.update({k: v for k, v in planner.items() if k in EXECUTOR_SETTINGS})
+            class_key = (tuple(sorted((k, str(v)) for k, v in others.items())),
+                         tuple(sorted(fingerprints.items())))
+            if class_key not in class_of:
+                class_of[class_key] = (len(representatives), n)
+                representatives.append(combination)
+            plan_class, representative = class_of[class_key]
+            row = {"combination": n, "plan_class": plan_class, "representative": representative}
+            row.update({k: str(v) for k, v in planner.items()})
+            row.update({"fp_" + q: f for q, f in fingerprints.items()})
+            rows.append(row)
+    finally:
+        for conn in connections.values():
+            conn.close()
+    print("[INFO] Pre-sweep : {0} combinations, {1} planner settings, {2} plan classes".format(
+        len(combinations), len(plans_of), len(representatives)))
+    return representatives, pd.DataFrame(rows)
@@ -0,0 +1,108 @@
+import array
+import json
+
+##
+#   Split of an EXPLAIN ANALYZE output into
+#     • a shape: the plan with every measured (actual) value and every value
+#       that depends on the query parameters or the cost settings (the
+#       estimates, the conditions with their literals) replaced by a type
+#       marker. The runs of the same plan share it, whatever the values
+#       drawn for a query template, so it is stored once.
+#     • an actuals vector: the numeric measured values in traversal order,
+#       packed as float64 (integers up to 2^53 are kept exactly)
+#     • extras: the non numeric measured values (sort method, JIT timing,
+#       per-worker details...), usually short or empty
+#   merge_plan(shape, actuals, extras) gives back the original output.
+##
+ACTUAL_KEYS = frozenset((
+    "Actual Startup Time", "Actual Total Time", "Actual Rows", "Actual Loops",
+    "Rows Removed by Filter", "Rows Removed by Index Recheck", "Rows Removed by Join Filter",
+    "Heap Fetches", "Exact Heap Blocks", "Lossy Heap Blocks",
+    "Shared Hit Blocks", "Shared Read Blocks", "Shared Dirtied Blocks", "Shared Written Blocks",
+    "Local Hit Blocks", "Local Read Blocks", "Local Dirtied Blocks", "Local Written Blocks",
+    "Temp Read Blocks", "Temp Written Blocks",
+    "I/O Read Time", "I/O Write Time", "Temp I/O Read Time", "Temp I/O Write Time",
+    "Sort Method", "Sort Space Used", "Sort Space Type",
+    "Peak Memory Usage", "Disk Usage", "HashAgg Batches",
+    "Hash Buckets", "Original Hash Buckets", "Hash Batches", "Original Hash Batches",
+    "Cache Hits", "Cache Misses", "Cache Evictions", "Cache Overflows",
+    "Full-sort Groups", "Pre-sorted Groups",
+    "Workers Launched", "Workers",
+    "Planning Time", "Execution Time", "Planning", "Triggers", "Timing",
+    "WAL Records", "WAL FPI", "WAL Bytes",
+))
+# values of the plan that change with the parameters of a query template
+# (the literals of the conditions, the estimates) or with the cost settings
+PARAMETER_KEYS = frozenset((
+    "Startup Cost", "Total Cost", "Plan Rows", "Plan Width",
+    "Filter", "Index Cond", "Recheck Cond", "Join Filter", "Hash Cond", "Merge Cond",
+    "One-Time Filter", "TID Cond", "Order By", "Subplans Removed",
+))
+# keys whose values are kept out of the shape (the shapes stored before
+# PARAMETER_KEYS keep their values in place, merge_plan reads both)
+VALUE_KEYS = ACTUAL_KEYS | PARAMETER_KEYS
+INT_MARK = "$i"
+FLOAT_MARK = "$f"
+EXTRA_MARK = "$x"
+
+def _split(obj, actuals, extras):
+    if isinstance(obj, dict):
+        shape = {}
+        for key, value in obj.items():
+            if key not in VALUE_KEYS:
+                shape[key] = _split(value, actuals, extras)
+            elif isinstance(value, bool) or not isinstance(value, (int, float)):
+                shape[key] = EXTRA_MARK
+                extras.append(value)
+            else:
+                shape[key] = INT_MARK if isinstance(value, int) else FLOAT_MARK
+                actuals.append(float(value))
+        return shape
+    if isinstance(obj, list):
+        return [_split(v, actuals, extras) for v in obj]
+    return obj
+
+def split_plan(explain):
+    actuals = array.array("d")
+    extras = []
+    shape = _split(explain, actuals, extras)
+    return shape, actuals, extras
+
+def _merge(shape, actuals, extras, pos):
+    if isinstance(shape, dict):
+        obj = {}
+        for key, value in shape.items():
+            if key in VALUE_KEYS and value == EXTRA_MARK:
+                obj[key] = extras[pos[1]]
+                pos[1] += 1
+            elif key in VALUE_KEYS and value in (INT_MARK, FLOAT_MARK):
+                number = actuals[pos[0]]
+                obj[key] = int(number) if value == INT_MARK else number
+                pos[0] += 1
+            else:
+                obj[key] = _merge(value, actuals, extras, pos)
+        return obj
+    if isinstance(shape, list):
+        return [_merge(v, actuals, extras, pos) for v in shape]
+    return shape
+
+def merge_plan(shape, actuals, extras):
+    return _merge(shape, actuals, extras or [], [0, 0])
+
+def pack_actuals(actuals: array.array):
+    return actuals.tobytes()
+
+def unpack_actuals(data: bytes):
+    actuals = array.array("d")
+    actuals.frombytes(data)
+    return actuals
+
+def pack_extras(extras: list):
+    if not extras:
+        return None
+    return json.dumps(extras, separators=(",", ":"))
+
+def unpack_extras(data):
+    if not data:
+        return []
+    return json.loads(data)
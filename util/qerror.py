@@ -0,0 +1,111 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+from util.plan_metrics import extract_report_dir, extract_store
+from util.result_store import ResultStore
+
+##
+#   Cardinality estimation error of every plan node.
+#   q-error = max(estimated, actual) / min(estimated, actual), with the
+#   estimated rows (Plan Rows x loops) and the actual rows (Actual Rows x
+#   loops) both clamped to at least 1. A q-error of 1 is a perfect estimate.
+##
+JOIN_NODE_TYPES = ("Nested Loop", "Hash Join", "Merge Join")
+
+def add_qerror_columns(nodes: pd.DataFrame):
+    nodes = nodes.copy()
+    loops = pd.to_numeric(nodes["loops"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    estimated = pd.to_numeric(nodes["plan_rows"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    actual = pd.to_numeric(nodes["actual_rows"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    estimated_total = np.maximum(estimated * np.maximum(loops, 1), 1.0)
+    actual_total = np.maximum(actual * loops, 1.0)
+    nodes["estimated_total_rows"] = estimated_total
+    nodes["actual_total_rows"] = actual_total
+    nodes["qerror"] = np.maximum(estimated_total, actual_total) / np.minimum(estimated_total, actual_total)
+    nodes["log_qerror"] = np.log10(nodes["qerror"].to_numpy())
+    # under : more rows than estimated, over : fewer rows than estimated
+    nodes["direction"] = np.where(actual_total > estimated_total, "under", "over")
+    nodes.loc[nodes["qerror"] == 1.0, "direction"] = "exact"
+    # never executed nodes (loops = 0) tell nothing about the estimates
+    nodes["executed"] = loops > 0
+    # log q-error weighted by the time spent in the node: the errors that cost time
+    nodes["impact"] = nodes["log_qerror"] * nodes["exclusive_ms"]
+    is_join = nodes["node_type"].isin(JOIN_NODE_TYPES)
+    nodes["kind"] = np.where(nodes["relation"].notna(), "scan", np.where(is_join, "join", "other"))
+    return nodes
+
+def _summary(df: pd.DataFrame, keys):
+    return df.groupby(keys).agg(
+        nodes=("qerror", "size"),
+        max_qerror=("qerror", "max"),
+        geomean_qerror=("log_qerror", lambda x: float(10 ** x.mean())),
+        bad_nodes=("qerror", lambda x: int((x > 10).sum())),
+        impact=("impact", "sum"),
+    ).reset_index().sort_values("impact", ascending=False)
+
+##
+#   Suggested remedy for a badly estimated scan: several ANDed conditions
+#   usually need extended statistics (correlated columns), a single one a
+#   higher statistics target on its column.
+##
+def suggest_statistics(predicate):
+    if not isinstance(predicate, str):
+        return "higher statistics target"
+    if " AND " in predicate.upper():
+        return "extended statistics (dependencies, mcv)"
+    return "higher statistics target"
+
+##
+#   Analyze a node table (util.plan_metrics) and return
+#     • by_query    → queries ranked by impact of their estimation errors
+#     • by_relation → scanned tables ranked the same way, with a suggestion
+#     • by_predicate → relation + predicate pairs
+#     • by_join_level → join nodes grouped by the number of relations joined
+##
+def analyze_qerror(nodes: pd.DataFrame):
+    if nodes.empty:
+        return None
+    nodes = add_qerror_columns(nodes)
+    executed = nodes[nodes["executed"]]
+    scans = executed[executed["kind"] == "scan"]
+    joins = executed[executed["kind"] == "join"]
+    by_predicate = _summary(scans.assign(predicate=scans["predicate"].fillna("")), ["relation", "predicate"])
+    by_predicate["suggestion"] = by_predicate["predicate"].map(suggest_statistics)
+    by_relation = _summary(scans, ["relation"])
+    worst_predicate = by_predicate.drop_duplicates("relation").set_index("relation")["suggestion"]
+    by_relation["suggestion"] = by_relation["relation"].map(worst_predicate)
+    return {
+        "nodes": nodes,
+        "by_query": _summary(executed, ["query"]),
+        "by_relation": by_relation,
+        "by_predicate": by_predicate,
+        "by_join_level": _summary(joins, ["relations_under"]).sort_values("relations_under"),
+    }
+
+def export_qerror(result: dict, out_dir):
+    if result is None:
+        print(f"[WARNING] No plan to analyse for {out_dir}")
+        return
+    os.makedirs(out_dir, exist_ok=True)
+    for name in ("by_query", "by_relation", "by_predicate", "by_join_level"):
+        result[name].to_csv(os.path.join(out_dir, "qerror_{}.csv".format(name)), index=False)
+    print("Queries with the most costly estimation errors:")
+    print(result["by_query"].head(10).to_string(index=False))
+    print("Tables where better statistics would pay off most:")
+    print(result["by_relation"].head(10).to_string(index=False))
+
+
+if __name__ == "__main__":
+    # python -m util.qerror ./report/report_<ts> [...]
+    # python -m util.qerror --store ./results [run id]
+    if len(sys.argv) > 2 and sys.argv[1] == "--store":
+        store = ResultStore(sys.argv[2])
+        run_filter = ds.field("run") == sys.argv[3] if len(sys.argv) > 3 else None
+        nodes = extract_store(store, store.read_measurements(filter=run_filter))
+        out_dir = os.path.join(sys.argv[2], "analysis")
+        export_qerror(analyze_qerror(nodes), out_dir)
+    else:
+        for path in sys.argv[1:]:
+            export_qerror(analyze_qerror(extract_report_dir(path)), path)
@@ -0,0 +1,152 @@
+import bisect
+import csv
+import json
+import os
+import random
+import re
+import psycopg2
+import psycopg2.extensions
+
+##
+#   Query templates: a query file may contain named placeholders {{name}}.
+#   The values come from a sidecar file <query file name>.params.json, e.g.
+#   for U-2.txt the file U-2.params.json:
+#   {
+#       "custom_field_id": {"source": "csv", "path": "./params/cf.csv", "column": "custom_field_id"},
+#       "item_id": {"source": "distinct", "distribution": "zipf", "s": 1.1,
+#                   "sql": "SELECT item_id FROM dct_items GROUP BY item_id ORDER BY count(*) DESC, item_id"},
+#       "position": {"source": "zipf", "min": 1, "max": 1000, "s": 1.2},
+#       "status": {"source": "list", "values": [1, 2, 5]}
+#   }
+#   csv / distinct / list draw from a list of values, uniformly by default or
+#   following a Zipf law on the rank of the value with "distribution": "zipf".
+#   zipf draws an integer in [min, max], min being the most frequent value.
+#   The sql of a distinct source sets the rank of the values: with
+#   "distribution": "zipf" it must have an ORDER BY (e.g. by frequency),
+#   without one the values are ordered by value so that a seed draws the
+#   same values on every run.
+#   The templates are loaded with the other queries from ./raw_queries
+#   (tested_queries/U-2_TEMPLATE.* is an example to copy there).
+##
+PLACEHOLDER_RE = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+PARAMS_SUFFIX = ".params.json"
+ORDER_BY_RE = re.compile(r"\border\s+by\b", re.IGNORECASE)
+
+def zipf_cum_weights(n, s):
+    cum_weights = []
+    total = 0.0
+    for k in range(1, n + 1):
+        total += 1.0 / (k ** s)
+        cum_weights.append(total)
+    return cum_weights
+
+class ParameterSource:
+    def __init__(self, values, distribution="uniform", s=1.0) -> None:
+        if not values:
+            raise ValueError("A parameter source needs at least one value")
+        self.values = values
+        self.cum_weights = None
+        if distribution == "zipf":
+            self.cum_weights = zipf_cum_weights(len(values), s)
+        elif distribution != "uniform":
+            raise ValueError("Unknown distribution: {}".format(distribution))
+
+    def draw(self, rng: random.Random):
+        if self.cum_weights is None:
+            return self.values[rng.randrange(len(self.values))]
+        x = rng.random() * self.cum_weights[-1]
+        return self.values[bisect.bisect_right(self.cum_weights, x)]
+
+##
+#   Build the value source described by one entry of the .params.json file.
+#   db_params is only needed for the "distinct" sources.
+##
+def make_parameter_source(spec: dict, db_params=None):
+    source = spec.get("source")
+    distribution = spec.get("distribution", "uniform")
+    s = float(spec.get("s", 1.0))
+    if source == "list":
+        values = list(spec["values"])
+    elif source == "csv":
+        with open(spec["path"], "r", newline="") as f:
+            values = [row[spec["column"]] for row in csv.DictReader(f) if row[spec["column"]] != ""]
+    elif source == "distinct":
+        if db_params is None:
+            raise ValueError("A database connection is needed to sample: {}".format(spec["sql"]))
+        with psycopg2.connect(**db_params) as conn:
+            cur = conn.cursor()
+            sql = spec["sql"]
+            if not ORDER_BY_RE.search(sql):
+                if distribution == "zipf":
+                    raise ValueError("The sql of a zipf source needs an ORDER BY (the rank of the values): {}".format(sql))
+                sql = "SELECT * FROM ({0}) AS sample ORDER BY 1".format(sql)
+            if "limit" in spec:
+                sql = "SELECT * FROM ({0}) AS sample LIMIT {1}".format(sql, int(spec["limit"]))
+            cur.execute(sql)
+            values = [row[0] for row in cur.fetchall()]
+    elif source == "zipf":
+        values = list(range(int(spec["min"]), int(spec["max"]) + 1))
+        distribution = "zipf"
+    else:
+        raise ValueError("Unknown parameter source: {}".format(source))
+    return ParameterSource(values, distribution, s)
+
+##
+#   Render a python value as a SQL literal.
+##
+def sql_literal(value):
+    return psycopg2.extensions.adapt(value).getquoted().decode("utf-8")
+
+class QueryTemplate:
+    def __init__(self, text:str, sources:dict) -> None:
+        self.text = text
+        self.sources = sources
+        missing = set(self.placeholders()) - set(sources)
+        if missing:
+            raise ValueError("No value source for the placeholders: {}".format(sorted(missing)))
+
+    def placeholders(self):
+        return [m.group(1) for m in PLACEHOLDER_RE.finditer(self.text)]
+
+    ##
+    #   Draw fresh values and return (query, values).
+    #   A placeholder used several times gets the same value everywhere.
+    ##
+    def render(self, rng: random.Random):
+        values = {name: self.sources[name].draw(rng) for name in set(self.placeholders())}
+        query = PLACEHOLDER_RE.sub(lambda m: sql_literal(values[m.group(1)]), self.text)
+        return query, values
+
+##
+#   One rendering of the queries of a folder (query file name → SQL), keyed by
+#   query name: the templates are drawn once with the seed, for the drivers
+#   that send the same SQL all along a run.
+##
+def render_queries(query_dict:dict, templates=None, seed=0):
+    templates = templates or {}
+    rng = random.Random(seed)
+    return {k.split('.')[0]: (templates[k].render(rng)[0] if k in templates else v)
+            for k, v in query_dict.items()}
+
+def params_file_of(query_path:str):
+    return os.path.splitext(query_path)[0] + PARAMS_SUFFIX
+
+##
+#   Load the templates of a query folder: every query file having a
+#   .params.json sidecar becomes a QueryTemplate, keyed by the query file name.
+##
+def load_query_templates(from_here:str, db_params=None):
+    templates = {}
+    for query in os.listdir(from_here):
+        if query.endswith(PARAMS_SUFFIX):
+            continue
+        params_path = params_file_of(os.path.join(from_here, query))
+        if not os.path.exists(params_path):
+            continue
+        with open(os.path.join(from_here, query), "r") as f:
+            text = f.read()
+        with open(params_path, "r") as f:
+            specs = json.load(f)
+        sources = {name: make_parameter_source(spec, db_params) for name, spec in specs.items()}
+        templates[query] = QueryTemplate(text, sources)
+    return templates
@@ -0,0 +1,179 @@
+import os
+import json
+import gzip
+import hashlib
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from util.plan_store import split_plan, merge_plan, pack_actuals, unpack_actuals, pack_extras, unpack_extras
+
+##
+#   Columnar store of the test results.
+#
+#   <root>/measurements/run=<run id>/mode=<Warm|Cold>/<conf id>-<n>.parquet
+#       one row per executed query (times, budget, fingerprint, plan totals...)
+#   <root>/configs/<conf id>.parquet
+#       one row per configuration set, one column per parameter
+#   <root>/plans/<sha[:2]>/<sha>.json.gz
+#       the shapes of the EXPLAIN outputs (see util.plan_store), compressed
+#       and addressed by the hash of their content, so a plan is stored once.
+#       The measured values of every run are kept in the plan_actuals and
+#       plan_extras columns of its measurement row.
+##
+MEASUREMENT_SCHEMA = pa.schema([
+    ("conf_id", pa.string()),
+    ("query", pa.string()),
+    ("sql", pa.string()),
+    ("iteration", pa.int32()),
+    ("timestamp", pa.int64()),
+    ("exec_time", pa.float64()),
+    ("plan_time", pa.float64()),
+    ("total_time", pa.float64()),
+    ("budget", pa.float64()),
+    ("censored", pa.bool_()),
+    ("params", pa.string()),
+    ("fingerprint", pa.string()),
+    ("plan_sha", pa.string()),
+    ("plan_actuals", pa.binary()),
+    ("plan_extras", pa.string()),
+    ("shared_hit", pa.float64()),
+    ("shared_read", pa.float64()),
+    ("shared_dirtied", pa.float64()),
+    ("shared_written", pa.float64()),
+    ("local_hit", pa.float64()),
+    ("local_read", pa.float64()),
+    ("temp_read", pa.float64()),
+    ("temp_written", pa.float64()),
+    ("io_read_time", pa.float64()),
+    ("io_write_time", pa.float64()),
+    ("temp_io_read_time", pa.float64()),
+    ("temp_io_write_time", pa.float64()),
+    ("workers_launched", pa.float64()),
+    ("jit_functions", pa.float64()),
+    ("jit_generation_ms", pa.float64()),
+    ("jit_inlining_ms", pa.float64()),
+    ("jit_optimization_ms", pa.float64()),
+    ("jit_emission_ms", pa.float64()),
+    ("jit_total_ms", pa.float64()),
+])
+PARTITION_SCHEMA = pa.schema([("run", pa.string()), ("mode", pa.string())])
+
+def content_hash(obj):
+    text = json.dumps(obj, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+class ResultStore:
+    def __init__(self, root="./results") -> None:
+        self.root = root
+        self.measurements_dir = os.path.join(root, "measurements")
+        self.configs_dir = os.path.join(root, "configs")
+        self.plans_dir = os.path.join(root, "plans")
+        for d in (self.measurements_dir, self.configs_dir, self.plans_dir):
+            os.makedirs(d, exist_ok=True)
+        # loaded plan shapes, a few shapes are shared by a lot of runs
+        self.shape_cache = {}
+
+    ##
+    #   Store a configuration set (dict parameter → value), return its id.
+    ##
+    def put_config(self, conf: dict):
+        conf_id = content_hash(conf)[:16]
+        path = os.path.join(self.configs_dir, conf_id + ".parquet")
+        if not os.path.exists(path):
+            row = {"conf_id": [conf_id]}
+            row.update({k: [str(v)] for k, v in conf.items()})
+            pq.write_table(pa.table(row), path)
+        return conf_id
+
+    def read_configs(self):
+        frames = [pq.read_table(os.path.join(self.configs_dir, f)).to_pandas()
+                  for f in sorted(os.listdir(self.configs_dir)) if f.endswith(".parquet")]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True).set_index("conf_id")
+
+    def plan_path(self, sha):
+        return os.path.join(self.plans_dir, sha[:2], sha + ".json.gz")
+
+    ##
+    #   Store the shape of an EXPLAIN output once, return
+    #   (shape hash, packed actuals vector, packed extras) for the measurement row.
+    ##
+    def put_plan(self, explain):
+        shape, actuals, extras = split_plan(explain)
+        sha = content_hash(shape)
+        path = self.plan_path(sha)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                json.dump(shape, f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        return sha, pack_actuals(actuals), pack_extras(extras)
+
+    def get_shape(self, sha):
+        if sha not in self.shape_cache:
+            with gzip.open(self.plan_path(sha), "rt", encoding="utf-8") as f:
+                self.shape_cache[sha] = json.load(f)
+        return self.shape_cache[sha]
+
+    ##
+    #   Rebuild the EXPLAIN output of a run from its shape and actuals.
+    #   Without actuals the stored document is returned as is.
+    ##
+    def get_plan(self, sha, actuals=None, extras=None):
+        shape = self.get_shape(sha)
+        if actuals is None:
+            return shape
+        return merge_plan(shape, unpack_actuals(actuals), unpack_extras(extras))
+
+    ##
+    #   Append the rows of a report (dict column → list, as built by run_test)
+    #   to the measurements of a run. Columns missing from the report are null,
+    #   columns unknown to the schema are ignored.
+    ##
+    def append_measurements(self, report_dct: dict, run_id: str, mode: str, conf_id: str):
+        n = len(report_dct["sql"])
+        if n == 0:
+            return None
+        columns = {}
+        for field in MEASUREMENT_SCHEMA:
+            if field.name == "conf_id":
+                values = [conf_id] * n
+            elif field.name == "query":
+                values = [s.rsplit("_", 1)[0] for s in report_dct["sql"]]
+            elif field.name == "iteration":
+                values = [int(s.rsplit("_", 1)[1]) for s in report_dct["sql"]]
+            else:
+                values = report_dct.get(field.name, [None] * n)
+            columns[field.name] = pa.array(values, type=field.type, from_pandas=True)
+        table = pa.table(columns, schema=MEASUREMENT_SCHEMA)
+        part_dir = os.path.join(self.measurements_dir, "run={}".format(run_id), "mode={}".format(mode))
+        os.makedirs(part_dir, exist_ok=True)
+        path = os.path.join(part_dir, "{0}-{1}.parquet".format(conf_id, uuid.uuid4().hex[:8]))
+        pq.write_table(table, path, compression="zstd")
+        return path
+
+    def dataset(self):
+        schema = pa.unify_schemas([MEASUREMENT_SCHEMA, PARTITION_SCHEMA])
+        return ds.dataset(self.measurements_dir, format="parquet", schema=schema,
+                          partitioning=ds.partitioning(PARTITION_SCHEMA, flavor="hive"))
+
+    ##
+    #   Read the measurements as a DataFrame, e.g.
+    #   store.read_measurements(filter=(ds.field("run") == run_id), columns=["query", "total_time"])
+    ##
+    def read_measurements(self, filter=None, columns=None):
+        return self.dataset().to_table(filter=filter, columns=columns).to_pandas()
+
+    ##
+    #   Measurements joined with the parameters of their configuration.
+    ##
+    def read_with_configs(self, filter=None, columns=None):
+        measurements = self.read_measurements(filter, columns)
+        configs = self.read_configs()
+        if configs.empty or "conf_id" not in measurements.columns:
+            return measurements
+        return measurements.join(configs, on="conf_id")
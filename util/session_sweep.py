@@ -0,0 +1,211 @@
+import os
+import itertools
+import statistics
+import psycopg2
+import psycopg2.extensions
+import pandas as pd
+from util.connection import Connection
+from util.plan_analysis import plan_fingerprint
+from util.plan_metrics import jit_totals, JIT_COLUMNS
+from util.query_template import render_queries
+
+##
+#   Sweeps of settings that can be changed with SET in the benchmark
+#   session: no configuration file is written and the server is not
+#   restarted, every combination is measured on the running server.
+##
+
+##
+#   Planning mode: the planning time of the wide joins depends on how many
+#   relations the planner reorders exhaustively (collapse limits) and on
+#   when the genetic optimizer takes over.
+##
+PLANNING_GRID = {
+    "join_collapse_limit": [1, 8, 12, 16],
+    "from_collapse_limit": [8, 12, 16],
+    "geqo_threshold": [12, 16, 24],
+    "geqo_effort": [1, 5, 10],
+}
+
+##
+#   JIT mode: does compiling the expressions pay for itself. The thresholds
+#   are compared to the total cost of the plan.
+##
+JIT_GRID = {
+    "jit": ["off", "on"],
+    "jit_above_cost": [0, 100000, 500000],
+    "jit_inline_above_cost": [0, 500000, -1],
+    "jit_optimize_above_cost": [0, 500000, -1],
+}
+
+JIT_DEFAULTS = {"jit_above_cost": 100000, "jit_inline_above_cost": 500000, "jit_optimize_above_cost": 500000}
+
+def grid_product(grid:dict):
+    return [dict(zip(grid, x)) for x in itertools.product(*grid.values())]
+
+##
+#   Planning time (ms) of repeat EXPLAIN SUMMARY of the query on one session.
+#   The first EXPLAIN fills the catalog caches of the session and is dropped.
+##
+def measure_planning(conn:Connection, settings:dict, repeat=20):
+    explain = conn.get_plan_of_query(settings, summary=True)
+    times = []
+    for _ in range(repeat):
+        explain = conn.get_plan_of_query(summary=True)
+        times.append(explain["Planning Time"])
+    return times, explain
+
+##
+#   Execution of the query under the settings, one fresh session per run.
+#   Returns the EXPLAIN ANALYZE outputs, None for a run cancelled by timeout_ms.
+##
+def measure_execution(params:dict, query:str, settings:dict, repeat=3, timeout_ms=None):
+    explains = []
+    for _ in range(repeat):
+        conn = Connection(params=params, query=query)
+        try:
+            explains.append(conn.get_explain_of_query(timeout_ms=timeout_ms, settings=settings))
+        except psycopg2.extensions.QueryCanceledError:
+            explains.append(None)
+        finally:
+            conn.close()
+    return explains
+
+def _median(values):
+    values = [v for v in values if v is not None]
+    return statistics.median(values) if values else None
+
+##
+#   Planning-time sweep: for every query and every combination of the grid,
+#   the planning time of repeat_plan EXPLAIN and the execution time of
+#   repeat_exec EXPLAIN ANALYZE (0 skips the execution).
+##
+def run_planning_sweep(query_dict:dict, params:dict, grid=PLANNING_GRID, repeat_plan=20, repeat_exec=3,
+                       timeout_ms=None, templates=None):
+    queries = render_queries(query_dict, templates)
+    rows = []
+    for sql_name, query in queries.items():
+        for settings in grid_product(grid):
+            conn = Connection(params=params, query=query)
+            try:
+                plan_times, explain = measure_planning(conn, settings, repeat_plan)
+            except psycopg2.Error as e:
+                print("[WARNING] EXPLAIN of", sql_name, "failed with", settings, ":", str(e).strip())
+                continue
+            finally:
+                conn.close()
+            explains = measure_execution(params, query, settings, repeat_exec, timeout_ms) if repeat_exec else []
+            exec_times = [e["Execution Time"] if e is not None else None for e in explains]
+            row = {"sql": sql_name}
+            row.update(settings)
+            row.update({
+                "fingerprint": plan_fingerprint(explain),
+                "plan_ms_median": statistics.median(plan_times),
+                "plan_ms_min": min(plan_times),
+                "plan_ms_max": max(plan_times),
+                "exec_ms_median": _median(exec_times),
+                "exec_timeouts": sum(1 for t in exec_times if t is None),
+            })
+            if row["exec_ms_median"] is not None:
+                row["total_ms"] = row["plan_ms_median"] + row["exec_ms_median"]
+            print(sql_name, settings, "plan :", row["plan_ms_median"], "ms exec :", row["exec_ms_median"], "ms")
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+##
+#   Scatter of the median planning time vs the median execution time of
+#   every combination, one chart per query. Needs matplotlib.
+##
+def plot_tradeoff(df:pd.DataFrame, out_dir, x="plan_ms_median", y="exec_ms_median", label_columns=None):
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("[WARNING] matplotlib is not installed, no chart is drawn")
+        return
+    if label_columns is None:
+        label_columns = [c for c in PLANNING_GRID if c in df.columns]
+    for sql_name, group in df.dropna(subset=[x, y]).groupby("sql"):
+        fig, ax = plt.subplots(figsize=(8, 6))
+        ax.scatter(group[x], group[y])
+        for _, row in group.iterrows():
+            label = ",".join(str(row[c]) for c in label_columns)
+            ax.annotate(label, (row[x], row[y]), fontsize=6)
+        ax.set_xlabel(x)
+        ax.set_ylabel(y)
+        ax.set_title("{0} ({1})".format(sql_name, ",".join(label_columns)))
+        fig.savefig(os.path.join(out_dir, "{}_tradeoff.png".format(sql_name)), dpi=120)
+        plt.close(fig)
+
+##
+#   Combinations of a JIT grid: with jit off the thresholds do not matter,
+#   so a single combination is kept for it.
+##
+def jit_combinations(grid=JIT_GRID):
+    combinations = []
+    jit_off = False
+    for settings in grid_product(grid):
+        if str(settings.get("jit", "on")) == "off":
+            if jit_off:
+                continue
+            jit_off = True
+            settings = {"jit": "off"}
+        combinations.append(settings)
+    return combinations
+
+##
+#   JIT sweep: repeat EXPLAIN ANALYZE of every query under every combination,
+#   with the median planning, execution and JIT compilation times.
+##
+def run_jit_sweep(query_dict:dict, params:dict, grid=JIT_GRID, repeat=5, timeout_ms=None, templates=None):
+    queries = render_queries(query_dict, templates)
+    rows = []
+    for sql_name, query in queries.items():
+        for settings in jit_combinations(grid):
+            explains = measure_execution(params, query, settings, repeat, timeout_ms)
+            done = [e for e in explains if e is not None]
+            row = {"sql": sql_name}
+            row.update({k: settings.get(k) for k in grid})
+            row["runs"] = len(done)
+            row["timeouts"] = len(explains) - len(done)
+            if done:
+                row["plan_ms_median"] = _median([e["Planning Time"] for e in done])
+                row["exec_ms_median"] = _median([e["Execution Time"] for e in done])
+                row["total_ms"] = row["plan_ms_median"] + row["exec_ms_median"]
+                jit = [jit_totals(e) for e in done]
+                for col in JIT_COLUMNS:
+                    row[col] = _median([j[col] for j in jit])
+            print(sql_name, settings, "total :", row.get("total_ms"), "ms jit :", row.get("jit_total_ms"), "ms")
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+##
+#   Per query: the total time with jit off, the best jit-on combination, the
+#   time this combination spends compiling, and whether JIT pays for itself
+#   (the best jit-on total is lower than the jit-off one).
+##
+def jit_payoff(df:pd.DataFrame):
+    rows = []
+    for sql_name, group in df.dropna(subset=["total_ms"]).groupby("sql"):
+        off = group[group["jit"].astype(str) == "off"]
+        on = group[group["jit"].astype(str) != "off"].sort_values("total_ms")
+        if off.empty or on.empty:
+            continue
+        best = on.iloc[0]
+        baseline = off["total_ms"].iloc[0]
+        row = {"sql": sql_name, "jit_off_ms": baseline, "best_jit_ms": best["total_ms"],
+               "jit_compile_ms": best["jit_total_ms"], "gain_ms": baseline - best["total_ms"],
+               "pays_off": bool(best["total_ms"] < baseline),
+               "default_thresholds_ms": None}
+        thresholds = [k for k in JIT_DEFAULTS if k in on.columns]
+        for k in thresholds:
+            row["best_" + k] = best[k]
+        # the shipped thresholds, when they are in the grid
+        default = on
+        for k in thresholds:
+            default = default[pd.to_numeric(default[k], errors="coerce") == JIT_DEFAULTS[k]]
+        if thresholds and not default.empty:
+            row["default_thresholds_ms"] = default["total_ms"].iloc[0]
+        rows.append(row)
+    return pd.DataFrame(rows)
@@ -0,0 +1,84 @@
+import math
+
+##
+#   Statistics of latency samples where some runs were cancelled by their
+#   time budget. A cancelled run is right-censored: we only know that its
+#   time is above the budget, so it is kept as a sample at the budget value
+#   with censored=True instead of being dropped.
+##
+
+##
+#   Kaplan-Meier estimate of the survival function S(t) = P(T > t).
+#   Returns a list of (time, survival) at every uncensored time.
+##
+def kaplan_meier(times, censored):
+    samples = sorted(zip(times, censored), key=lambda x: (x[0], x[1]))
+    at_risk = len(samples)
+    survival = 1.0
+    curve = []
+    i = 0
+    while i < len(samples):
+        t = samples[i][0]
+        events = 0
+        removed = 0
+        while i < len(samples) and samples[i][0] == t:
+            if not samples[i][1]:
+                events += 1
+            removed += 1
+            i += 1
+        if events > 0:
+            survival *= 1.0 - events / at_risk
+            curve.append((t, survival))
+        at_risk -= removed
+    return curve
+
+##
+#   Median of the Kaplan-Meier estimate, None when more than half of the
+#   runs were censored (the median is then only known to be above the budget).
+##
+def km_quantile(times, censored, q=0.5):
+    for t, survival in kaplan_meier(times, censored):
+        if survival <= 1.0 - q:
+            return t
+    return None
+
+##
+#   Summary of censored samples:
+#     • restricted_mean → mean with the censored samples at their budget,
+#                         a lower bound of the true mean
+#     • km_median / km_p90 → Kaplan-Meier quantiles (None if not reached)
+##
+def censored_summary(times, censored):
+    times = [float(t) for t in times]
+    censored = [bool(c) for c in censored]
+    n = len(times)
+    return {
+        "n": n,
+        "n_censored": sum(censored),
+        "restricted_mean": sum(times) / n if n else math.nan,
+        "km_median": km_quantile(times, censored, 0.5),
+        "km_p90": km_quantile(times, censored, 0.9),
+        "min": min(times) if n else math.nan,
+    }
+
+##
+#   Samples without the warm-up run (the first iteration), as in the
+#   averages of the reports. A single run is kept.
+##
+def drop_warmup(values):
+    values = list(values)
+    return values[1:] if len(values) > 1 else values
+
+##
+#   censored_summary of every group of a measurement table (one row per
+#   executed query with iteration, total_time and censored columns),
+#   without the warm-up run of every group.
+##
+def censored_summary_table(df, keys):
+    rows = []
+    for key, group in df.sort_values("iteration").groupby(keys, sort=True):
+        key = key if isinstance(key, tuple) else (key,)
+        row = dict(zip(keys, key))
+        row.update(censored_summary(drop_warmup(group["total_time"]), drop_warmup(group["censored"])))
+        rows.append(row)
+    return rows